@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the Drain parser
+    leaf: compares the per-line latency of matching a message against a leaf node by comparing templates one by one
+          with comparing the whole token matrix of the leaf at once, for leaf nodes of increasing size
+    preprocess: checks that the compiled preprocessing pipeline gives the same messages as applying each regular
+                expression with re.sub in turn, and compares their speed on the contents of a log file
+    parameters: compares extracting the parameters of generated log lines one row at a time, building the regular
+                expression of the template for every row, with extracting them per template from a compiled one
+
+Examples:
+    ./benchmark_drain.py leaf --length 12 --messages 2000
+    ./benchmark_drain.py preprocess -f '<Month> <Date> <Time> <Type> <Component>: <Content>' ../../input/auth.log
+    ./benchmark_drain.py parameters --lines 1000000
+"""
+import argparse
+import random
+import sys
+import time
+from array import array
+
+import regex as re
+
+from logparser import Drain
+from preprocessing import regex
+
+LEAF_SIZES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+def generate_leaf(parser, size, length, vocabulary):
+    """ Builds a leaf node of size log clusters, whose templates have length tokens, a few of them wildcards
+    """
+    leaf = Drain.LeafClusters()
+    for clusterId in range(size):
+        template = [random.choice(vocabulary) for _ in range(length)]
+        for idx in random.sample(range(length), random.randint(0, length // 3)):
+            template[idx] = '<*>'
+        leaf.append(Drain.Logcluster(logTemplate=array('i', parser.internTokens(template)), clusterId=clusterId))
+    return leaf
+
+
+def generate_messages(parser, leaf, count, vocabulary):
+    """ Derives messages from the templates of a leaf node, changing some of their tokens so that
+        they match with varying similarity, and maps them to token IDs as LogParser.addLine does
+    """
+    messages = []
+    for _ in range(count):
+        message = [parser.tokens[tokenId] for tokenId in random.choice(leaf).logTemplate]
+        for idx in random.sample(range(len(message)), random.randint(0, len(message) // 2)):
+            message[idx] = random.choice(vocabulary) + str(random.randint(0, 9))
+        message = [token if token != '<*>' else str(random.randint(0, 999)) for token in message]
+        messages.append([parser.tokenIds.get(token, -1) for token in message])
+    return messages
+
+
+def time_matches(parser, leaf, messages, leaf_matrix):
+    """ Matches every message against the leaf node, returning the matched log clusters and the time taken per line
+    """
+    parser.leaf_matrix = leaf_matrix
+    start = time.perf_counter()
+    matches = [parser.fastMatch(leaf, message) for message in messages]
+    return matches, (time.perf_counter() - start) / len(messages)
+
+
+def benchmark_leaves(args):
+    random.seed(0)
+    vocabulary = ['token{0}'.format(i) for i in range(50)]
+    parser = Drain.LogParser('<Content>', st=args.st)
+
+    print('{0:>9} {1:>12} {2:>12} {3:>8}'.format('leaf size', 'loop (us)', 'matrix (us)', 'speedup'))
+    for size in LEAF_SIZES:
+        leaf = generate_leaf(parser, size, args.length, vocabulary)
+        messages = generate_messages(parser, leaf, args.messages, vocabulary)
+        parser.leafMatrix(leaf)
+
+        expected, loop_time = time_matches(parser, leaf, messages, None)
+        matches, matrix_time = time_matches(parser, leaf, messages, 1)
+        assert matches == expected, 'matrix match differs from fastMatch for leaf size {0}'.format(size)
+        print('{0:>9} {1:>12.1f} {2:>12.1f} {3:>7.1f}x'.format(size, loop_time * 1e6, matrix_time * 1e6, loop_time / matrix_time))
+
+
+def preprocess_sequential(rex, line):
+    """ Preprocesses a message as Drain did before the compiled pipeline, with one re.sub per regular expression
+    """
+    for currentRex in rex:
+        line = re.sub(currentRex, '<*>', line)
+    return line
+
+
+def benchmark_preprocess(args):
+    parser = Drain.LogParser(args.format, rex=regex)
+    headers, logRegex = parser.generate_logformat_regex(args.format)
+    contentIdx = headers.index('Content')
+    contents = [message[contentIdx] for _, message in parser.iter_log(args.log, logRegex, headers)][:args.lines]
+
+    start = time.perf_counter()
+    expected = [preprocess_sequential(regex, content) for content in contents]
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [parser.preprocess(content) for content in contents]
+    pipeline_time = time.perf_counter() - start
+
+    mismatches = [idx for idx in range(len(contents)) if results[idx] != expected[idx]]
+    for idx in mismatches[:10]:
+        print('Mismatch on message {0}: {1!r}\n    sequential: {2!r}\n    pipeline:   {3!r}'.format(
+            idx + 1, contents[idx], expected[idx], results[idx]))
+    print('Preprocessed {0} messages, {1} mismatches'.format(len(contents), len(mismatches)))
+    print('sequential: {0:.1f} us/line'.format(sequential_time / len(contents) * 1e6))
+    print('pipeline:   {0:.1f} us/line, {1:.1f}x faster'.format(pipeline_time / len(contents) * 1e6, sequential_time / pipeline_time))
+    if mismatches:
+        sys.exit(1)
+
+
+def parameter_list_uncached(row):
+    """ Extracts the parameters of a row as Drain did before caching the regular expression of each template
+    """
+    template_regex = re.sub(r"<.{1,5}>", "<*>", row["EventTemplate"])
+    if "<*>" not in template_regex: return []
+    template_regex = re.sub(r'([^A-Za-z0-9])', r'\\\1', template_regex)
+    template_regex = re.sub(r'\\ +', r'\\s+', template_regex)
+    template_regex = "^" + template_regex.replace(r"\<\*\>", "(.*?)") + "$"
+    parameter_list = re.findall(template_regex, row["Content"])
+    parameter_list = parameter_list[0] if parameter_list else ()
+    parameter_list = list(parameter_list) if isinstance(parameter_list, tuple) else [parameter_list]
+    return parameter_list
+
+
+def generate_rows(templates, lines):
+    """ Generates templates that look like syslog messages, and lines with values filled in for their parameters
+    """
+    words = ['session', 'opened', 'closed', 'for', 'user', 'by', 'from', 'port', 'ssh2', 'Accepted', 'publickey',
+             'Connection', 'reset', '(uid=<*>)', 'pid', '[<*>]', 'Started', 'Stopped', 'service', 'failed:']
+    values = ['root', 'www-data', '192.168.1.17', '4711', '0', 'eth0', '/var/log/syslog', 'a7f3c9']
+
+    templateL = []
+    for _ in range(templates):
+        template = [random.choice(words) for _ in range(random.randint(4, 14))]
+        for idx in random.sample(range(len(template)), random.randint(0, 3)):
+            template[idx] = '<*>'
+        templateL.append(' '.join(template))
+
+    rows = []
+    for _ in range(lines):
+        template = random.choice(templateL)
+        content = template.replace('<*>', '{}').format(*[random.choice(values) for _ in range(template.count('<*>'))])
+        rows.append((template, content))
+    return rows
+
+
+def benchmark_parameters(args):
+    random.seed(0)
+    rows = generate_rows(args.templates, args.lines)
+
+    start = time.perf_counter()
+    expected = [parameter_list_uncached({'EventTemplate': template, 'Content': content}) for template, content in rows]
+    uncached_time = time.perf_counter() - start
+
+    # Compiled once per template, as in LogParser.outputStructured
+    start = time.perf_counter()
+    parser = Drain.LogParser('<Content>')
+    groups = {}
+    for idx, (template, _) in enumerate(rows):
+        groups.setdefault(template, []).append(idx)
+    results = [None] * len(rows)
+    for template, idxL in groups.items():
+        template_regex = parser.parameterRegex(template)
+        for idx in idxL:
+            results[idx] = parser.extractParameters(template_regex, rows[idx][1])
+    grouped_time = time.perf_counter() - start
+
+    assert results == expected, 'grouped parameter extraction differs from the uncached one'
+    print('Extracted parameters of {0} lines with {1} templates'.format(len(rows), len(groups)))
+    print('per row:      {0:.2f}s ({1:.1f} us/line)'.format(uncached_time, uncached_time / len(rows) * 1e6))
+    print('per template: {0:.2f}s ({1:.1f} us/line), {2:.1f}x faster'.format(
+        grouped_time, grouped_time / len(rows) * 1e6, uncached_time / grouped_time))
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Benchmarks for the Drain parser')
+    subparsers = argparser.add_subparsers(dest='benchmark', required=True)
+
+    leaf = subparsers.add_parser('leaf', help='match messages against leaf nodes of increasing size')
+    leaf.add_argument('--length', '-l', type=int, default=12, help='number of tokens per message (default: 12)')
+    leaf.add_argument('--messages', '-m', type=int, default=2000, help='number of messages per leaf size (default: 2000)')
+    leaf.add_argument('--st', type=float, default=0.5, help='similarity threshold (default: 0.5)')
+    leaf.set_defaults(run=benchmark_leaves)
+
+    preprocess = subparsers.add_parser('preprocess', help='preprocess the messages of a log file')
+    preprocess.add_argument('log', help='log file to take the messages from')
+    preprocess.add_argument('--format', '-f', required=True, help='log format of the file, with a <Content> field')
+    preprocess.add_argument('--lines', '-n', type=int, default=None, help='number of messages to preprocess (default: all)')
+    preprocess.set_defaults(run=benchmark_preprocess)
+
+    parameters = subparsers.add_parser('parameters', help='extract the parameters of generated log lines')
+    parameters.add_argument('--lines', '-n', type=int, default=1000000, help='number of lines to generate (default: 1000000)')
+    parameters.add_argument('--templates', '-t', type=int, default=300, help='number of templates to generate (default: 300)')
+    parameters.set_defaults(run=benchmark_parameters)
+
+    args = argparser.parse_args()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
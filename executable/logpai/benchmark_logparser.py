@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+Benchmarks shared by the log parsers
+    logformat: checks that matching log lines through LogFormatRegex gives the same header fields as the lazy regular
+               expression of the log format, for the log formats of the shipped configuration files, on the lines of
+               the test logs they apply to and on generated lines, and compares their speed on the test logs, or on
+               well-formed generated lines for log formats without any
+    parsers: runs each log parser on the same sample of a test log from a baseline git revision of the parsers and
+             from the working tree, comparing the time they take and checking that their outputs are identical
+
+Examples:
+    ./benchmark_logparser.py logformat
+    ./benchmark_logparser.py logformat --generated 100000 ../../src/test/resources/auth-config.yaml
+    ./benchmark_logparser.py parsers --baseline HEAD~1 --lines 5000 IPLoM Spell
+"""
+import argparse
+import glob
+import io
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from logparser.utils import logloader
+from preprocessing import regex
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+CONFIGS = os.path.join(ROOT, 'src', 'test', 'resources', '*-config.yaml')
+INPUT = os.path.join(ROOT, 'src', 'test', 'input')
+
+# Arguments the parsers are benchmarked with, besides the input and output directories, log format, and rex
+PARSERS = {
+    'AEL': dict(minEventCount=2, merge_percent=0.5),
+    'Drain': dict(depth=4, st=0.5),
+    'IPLoM': dict(CT=0.35, lowerBound=0.25),
+    'LFA': dict(),
+    'LKE': dict(split_threshold=3),
+    'LenMa': dict(threshold=0.9),
+    'LogCluster': dict(rsupport=10),
+    'LogSig': dict(groupNum=10),
+    'SHISO': dict(maxChildNum=4, mergeThreshold=0.002, formatLookupThreshold=0.3, superFormatThreshold=0.85),
+    'SLCT': dict(support=10),
+    'Spell': dict(tau=0.5),
+}
+
+# Script run in a separate process for each parser, printing the time it takes to parse. The module of the parser is
+# imported without running the __init__ of its package, as several of them only work on Python 2. The preprocessing
+# regular expressions are those of the working tree, passed in the script, as older trees have no preprocessing module
+PARSER_SCRIPT = """
+import importlib, sys, time, types
+sys.path.insert(0, '..')
+import logparser
+package = types.ModuleType('logparser.{parser}')
+package.__path__ = ['../logparser/{parser}']
+sys.modules['logparser.{parser}'] = package
+module = importlib.import_module('logparser.{parser}.{parser}')
+parser = module.LogParser(indir={indir!r}, outdir={outdir!r}, log_format={log_format!r}, rex={rex!r}, **{args!r})
+start = time.perf_counter()
+parser.parse({log_name!r})
+print('PARSE_TIME', time.perf_counter() - start)
+"""
+
+# Values generated lines fill header fields with, some of them holding whitespace or literal text of log formats
+FIELD_VALUES = ['mail', 'Mar', '3', '00:01:13', 'CRON[1234]', 'pam_unix(cron:session):', '127.0.0.1', '2019-03-04',
+                '[pid', '1]', '"GET', '/', '-', ':', ': ', ')', 'msg=audit(', 'a b', ' ', '', '  ', '\t', '.']
+
+# Values well-formed generated lines fill header fields other than the last with
+TOKEN_VALUES = ['mail', 'Mar', '3', '00:01:13', 'CRON[1234]', '127.0.0.1', '2019', 'info', 'sshd', '+0100']
+
+
+def config_value(config, key):
+    """ Reads a top level value of a configuration file, as the YAML parser of SLOGERT does for the simple values
+        they hold
+    """
+    with open(config) as fin:
+        for line in fin:
+            match = re.match(r'^%s:\s*(.*?)\s*$' % key, line)
+            if match:
+                value = match.group(1)
+                if value.startswith('"') and value.endswith('"'):
+                    value = re.sub(r'\\(.)', r'\1', value[1:-1])
+                return value
+    return None
+
+
+def config_format(config):
+    """ Reads the log format of a configuration file as it ends up in the parser scripts, which LogInitializer writes
+        with String.replaceAll, dropping one more level of backslashes
+    """
+    return re.sub(r'\\(.)', r'\1', config_value(config, 'format'))
+
+
+def config_lines(config):
+    """ Reads the lines of the test logs a configuration file applies to, prefixed with their device, as
+        LogInitializer does
+    """
+    source = config_value(config, 'source')
+    lines = []
+    for device in sorted(os.listdir(INPUT)):
+        for root, _, files in sorted(os.walk(os.path.join(INPUT, device))):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if path.endswith(source):
+                    with open(path) as fin:
+                        lines.extend('{0} {1}'.format(device, line.rstrip('\n')).strip() for line in fin)
+    return lines
+
+
+def generate_lines(logformat, count, wellFormed=False):
+    """ Generates lines by filling the header fields of a log format with values, and sometimes widening the spaces
+        between them, so that many lines only match if fields hold whitespace or literal text. Well-formed lines
+        instead have one token in each field but the last, which holds a few words, as log lines usually do.
+    """
+    splitters = re.split(r'(<[^<>]+>)', logformat)
+    literals = [re.sub(r'\\(.)', r'\1', splitter) for splitter in splitters[0::2]]
+    lines = []
+    for _ in range(count):
+        line = ''
+        for k in range(len(splitters)):
+            if k % 2 and wellFormed:
+                last = k == len(splitters) - 2
+                line += ' '.join(random.choice(TOKEN_VALUES) for _ in range(random.randint(5, 30) if last else 1))
+            elif k % 2:
+                line += ''.join(random.choice(FIELD_VALUES) for _ in range(random.randint(0, 3)))
+            elif random.random() < 0.3 and not wellFormed:
+                line += re.sub(' ', lambda match: random.choice([' ', '  ', '\t', ' x ']), literals[k // 2])
+            else:
+                line += literals[k // 2]
+        lines.append(line.strip())
+    return lines
+
+
+def time_matches(regex, headers, lines):
+    """ Matches every line, returning the header fields of each line, or None if it does not match, and the time taken
+    """
+    start = time.perf_counter()
+    fields = []
+    for line in lines:
+        match = regex.search(line)
+        fields.append(match.group(*headers) if match is not None else None)
+    return fields, time.perf_counter() - start
+
+
+def benchmark_logformat(args):
+    random.seed(0)
+    configs = args.configs or sorted(glob.glob(CONFIGS))
+    print('{0:<28} {1:>8} {2:>9} {3:>10} {4:>10} {5:>8} {6:>10}'.format(
+        'config', 'log', 'generated', 'lazy (us)', 'new (us)', 'speedup', 'mismatches'))
+    failed = False
+    for config in configs:
+        logformat = config_format(config)
+        regex = logloader.LogFormatRegex(logformat)
+        headers = regex.headers
+        # Lines are timed on the test logs, or on well-formed generated lines for log formats without any
+        logLines = config_lines(config)
+        timedLines = logLines or generate_lines(logformat, args.generated, wellFormed=True)
+        lines = timedLines + generate_lines(logformat, args.generated)
+
+        expected, _ = time_matches(regex.full, headers, lines)
+        fields, _ = time_matches(regex, headers, lines)
+        mismatches = [idx for idx in range(len(lines)) if fields[idx] != expected[idx]]
+        for idx in mismatches[:5]:
+            print('Mismatch on {0!r}:\n    lazy: {1!r}\n    new:  {2!r}'.format(lines[idx], expected[idx], fields[idx]))
+        failed = failed or bool(mismatches)
+
+        _, lazy_time = time_matches(regex.full, headers, timedLines)
+        _, new_time = time_matches(regex, headers, timedLines)
+        print('{0:<28} {1:>8} {2:>9} {3:>10.2f} {4:>10.2f} {5:>7.1f}x {6:>10}'.format(
+            os.path.basename(config), len(logLines), len(lines) - len(logLines), lazy_time / len(timedLines) * 1e6,
+            new_time / len(timedLines) * 1e6, lazy_time / new_time, len(mismatches)))
+    if failed:
+        sys.exit(1)
+
+
+def extract_tree(revision, directory):
+    """ Extracts the log parsers of a git revision into directory, returning the path of their executable/logpai
+    """
+    archive = subprocess.run(['git', 'archive', revision, 'executable/logpai'], cwd=ROOT, check=True,
+                             stdout=subprocess.PIPE).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return os.path.join(directory, 'executable', 'logpai')
+
+
+def run_parser(tree, parser, indir, log_name, log_format, outdir):
+    """ Runs a parser of a tree on a log in a separate process, from a directory beside the logparser package as
+        parsers such as SLCT expect, returning the time it took to parse, or None and its output if it failed
+    """
+    workdir = os.path.join(tree, 'benchmark')
+    os.makedirs(workdir, exist_ok=True)
+    script = PARSER_SCRIPT.format(parser=parser, indir=indir, outdir=outdir, log_format=log_format,
+                                  rex=regex, args=PARSERS[parser], log_name=log_name)
+    result = subprocess.run([sys.executable, '-c', script], cwd=workdir, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True)
+    match = re.search(r'^PARSE_TIME (\S+)$', result.stdout, re.M)
+    if result.returncode != 0 or match is None:
+        return None, result.stdout
+    return float(match.group(1)), result.stdout
+
+
+def same_outputs(outdir, otherOutdir, log_name):
+    """ Checks that two runs of a parser wrote the same structured log and templates, as far as it writes them
+    """
+    for suffix in ['_structured.csv', '_templates.csv']:
+        paths = [os.path.join(directory, log_name + suffix) for directory in (outdir, otherOutdir)]
+        exist = [os.path.isfile(path) for path in paths]
+        if not any(exist):
+            continue
+        if not all(exist):
+            return False
+        with open(paths[0], 'rb') as fin, open(paths[1], 'rb') as otherFin:
+            if fin.read() != otherFin.read():
+                return False
+    return True
+
+
+def benchmark_parsers(args):
+    parsers = args.parsers or sorted(PARSERS)
+    logformat = config_format(args.config)
+    with tempfile.TemporaryDirectory() as directory:
+        indir = os.path.join(directory, 'input')
+        os.makedirs(indir)
+        log_name = 'sample.log'
+        with open(os.path.join(indir, log_name), 'w') as fout:
+            fout.writelines(line + '\n' for line in config_lines(args.config)[:args.lines])
+
+        trees = {'baseline': extract_tree(args.baseline, os.path.join(directory, 'baseline')),
+                 'current': os.path.join(directory, 'current', 'logpai')}
+        shutil.copytree(os.path.dirname(os.path.abspath(__file__)), trees['current'],
+                        ignore=shutil.ignore_patterns('__pycache__', '*.pyc', 'benchmark'))
+
+        print('{0:<12} {1:>12} {2:>12} {3:>8} {4:>8}'.format('parser', 'baseline (s)', 'current (s)', 'speedup', 'outputs'))
+        failed = False
+        for parser in parsers:
+            times = {}
+            outdirs = {}
+            for name, tree in trees.items():
+                outdirs[name] = os.path.join(directory, 'output', name, parser)
+                times[name], output = run_parser(tree, parser, indir, log_name, logformat, outdirs[name])
+                if times[name] is None:
+                    print('{0} failed with the {1} parsers:\n    {2}'.format(
+                        parser, name, output.strip().splitlines()[-1] if output.strip() else 'no output'))
+            if times['current'] is None:
+                failed = failed or times['baseline'] is not None
+                continue
+            if times['baseline'] is None:
+                print('{0:<12} {1:>12} {2:>12.2f} {3:>8} {4:>8}'.format(parser, '-', times['current'], '-', '-'))
+                continue
+            same = same_outputs(outdirs['baseline'], outdirs['current'], log_name)
+            failed = failed or not same
+            print('{0:<12} {1:>12.2f} {2:>12.2f} {3:>7.1f}x {4:>8}'.format(
+                parser, times['baseline'], times['current'], times['baseline'] / times['current'],
+                'same' if same else 'DIFFER'))
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Benchmarks shared by the log parsers')
+    subparsers = argparser.add_subparsers(dest='benchmark', required=True)
+
+    logformat = subparsers.add_parser('logformat', help='match log lines against the log formats of configuration files')
+    logformat.add_argument('configs', nargs='*', help='configuration files to take the log formats from (default: the shipped ones)')
+    logformat.add_argument('--generated', '-g', type=int, default=20000, help='number of lines to generate per log format (default: 20000)')
+    logformat.set_defaults(run=benchmark_logformat)
+
+    parsers = subparsers.add_parser('parsers', help='run the log parsers of a git revision and of the working tree')
+    parsers.add_argument('parsers', nargs='*', choices=[[]] + sorted(PARSERS), help='parsers to run (default: all)')
+    parsers.add_argument('--baseline', '-b', required=True, help='git revision to compare the parsers with, e.g. HEAD~1')
+    parsers.add_argument('--config', '-c', default=os.path.join(ROOT, 'src', 'test', 'resources', 'auth-config.yaml'),
+                         help='configuration file whose log format and test logs to parse (default: auth-config.yaml)')
+    parsers.add_argument('--lines', '-n', type=int, default=2000, help='number of lines of the test logs to parse (default: 2000)')
+    parsers.set_defaults(run=benchmark_parsers)
+
+    args = argparser.parse_args()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
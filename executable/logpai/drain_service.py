@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Long-running Drain parser for near-real-time KG updates
+Reads raw log lines from stdin (or from clients of a local UNIX socket) and matches them against a live parse tree,
+writing one JSON record with the LineId, EventId, EventTemplate, and ParameterList of each line as soon as it is parsed
+The templates are written to <outdir>/<name>_templates.csv every --flush-interval seconds if lines were parsed since
+they were last written, and when the service stops
+SIGTERM and Ctrl+C stop the service once the line being parsed is done, so that the parse tree is never saved half-updated
+
+Examples:
+    tail -F input/mail.cup.com/auth.log | ./drain_service.py -f '<Month> <Date> <Time> <Type> <Component>: <Content>' -n auth.log
+    ./drain_service.py -f '<Month> <Date> <Time> <Type> <Component>: <Content>' -n auth.log -s /tmp/drain-auth.sock
+"""
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+
+from logparser import Drain
+from preprocessing import regex
+
+
+class ServiceStopped(Exception):
+    """ Raised by the signal handler of the service to stop it while the main thread waits for input
+    """
+
+
+class DrainService:
+    """ Wraps a Drain parser in a lock, so that lines from several clients are parsed one at a time,
+        and flushes its templates every flush_interval seconds from a separate thread, even while no lines arrive
+    """
+    def __init__(self, parser, name, flush_interval):
+        self.parser = parser
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.parser.open_stream(name)
+        # Whether lines were parsed since the templates were last written, starting with the templates of state_file
+        self.pending = True
+        # Set by stop, and checked between lines, so that a signal never interrupts a parse tree update
+        self.stopping = False
+        # Whether the main thread waits for input, and can be interrupted by stop right away
+        self.waiting = False
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(target=self.flush_periodically)
+        self.flusher.start()
+
+    def parse_line(self, line):
+        with self.lock:
+            record = self.parser.parse_line(line)
+            self.pending = True
+        return record
+
+    def flush(self):
+        """ Writes the templates and saves the parse tree, if lines were parsed since they were last written,
+            with the lock held
+        """
+        if self.pending:
+            self.parser.flush_stream()
+            self.pending = False
+
+    def flush_periodically(self):
+        while not self.closed.wait(self.flush_interval):
+            with self.lock:
+                self.flush()
+
+    def stop(self, signum=None, frame=None):
+        """ Signal handler to stop the service after the line being parsed, or right away if it waits for input
+        """
+        self.stopping = True
+        if self.waiting:
+            raise ServiceStopped()
+
+    def close(self):
+        """ Stops the periodic flushes and flushes the templates one last time
+        """
+        self.closed.set()
+        self.flusher.join()
+        with self.lock:
+            self.flush()
+
+    def read_lines(self, stream):
+        """ Generator to read lines from a stream until it ends or the service stops, allowing stop to interrupt
+            the service while it waits for a line
+        """
+        while not self.stopping:
+            self.waiting = True
+            try:
+                line = stream.readline()
+            finally:
+                self.waiting = False
+            if not line:
+                return
+            yield line
+
+    def serve(self, lines, output):
+        """ Parses lines as they arrive, writing a JSON record for each line that matches the log format
+        """
+        for line in lines:
+            record = self.parse_line(line)
+            if record is not None:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+            if self.stopping:
+                break
+
+
+class _SocketWriter:
+    """ Text interface over the binary stream of a socket connection
+    """
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def serve_socket(service, path):
+    """ Serves clients of a UNIX socket at path, replying to each line sent with its JSON record
+    """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lines = (line.decode('utf-8', errors='replace') for line in self.rfile)
+            output = _SocketWriter(self.wfile)
+            service.serve(lines, output)
+
+    class Server(socketserver.ThreadingUnixStreamServer):
+        # Stopping must not wait for connected clients to disconnect, or the final flush would wait with it
+        daemon_threads = True
+        block_on_close = False
+
+    if os.path.exists(path):
+        os.remove(path)
+    with Server(path, Handler) as server:
+        print('Drain service listening on {0}'.format(path), file=sys.stderr)
+        # Lines are parsed by the threads of the clients, so the main thread can always be interrupted
+        service.waiting = True
+        try:
+            server.serve_forever()
+        finally:
+            service.waiting = False
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse log lines arriving on stdin or a UNIX socket with Drain')
+    parser.add_argument('--format', '-f', required=True, help='log format of the incoming lines, e.g. "<Month> <Date> <Time> <Type> <Component>: <Content>"')
+    parser.add_argument('--name', '-n', default='stream', help='name of the log, used for the <name>_templates.csv file (default: stream)')
+    parser.add_argument('--outdir', '-o', default='./', help='directory to write the templates file to (default: ./)')
+    parser.add_argument('--socket', '-s', help='path of a UNIX socket to listen on instead of reading stdin')
+    parser.add_argument('--state-file', help='parse tree to start from and save to, as written by Drain.LogParser with state_file')
+    parser.add_argument('--flush-interval', type=float, default=10.0, help='seconds between writes of the templates file (default: 10)')
+    parser.add_argument('--st', type=float, default=0.5, help='similarity threshold (default: 0.5)')
+    parser.add_argument('--depth', type=int, default=4, help='depth of all leaf nodes (default: 4)')
+    args = parser.parse_args()
+
+    drain = Drain.LogParser(args.format, outdir=args.outdir, depth=args.depth, st=args.st, rex=regex,
+                            state_file=args.state_file)
+    service = DrainService(drain, args.name, args.flush_interval)
+
+    # Stop cleanly on SIGTERM as well as Ctrl+C, so that the templates are flushed one last time
+    signal.signal(signal.SIGTERM, service.stop)
+    signal.signal(signal.SIGINT, service.stop)
+    try:
+        if args.socket:
+            serve_socket(service, args.socket)
+        else:
+            service.serve(service.read_lines(sys.stdin), sys.stdout)
+    except ServiceStopped:
+        pass
+    finally:
+        service.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Prints lines of a log file by line number, or by the LineId of the parsed log given the log format it was parsed with,
+for going back from a parsed line to the raw log line
+The offsets of the lines are indexed in <log file>.lineidx.npy the first time a file is read, and the lines matching
+each log format in <log file>.lineid-<hash>.npy, so that later lookups only read the lines asked for
+
+Examples:
+    ./log_lines.py input/mail.cup.com/auth.log 120
+    ./log_lines.py input/mail.cup.com/auth.log 120 130
+    ./log_lines.py -f '<Month> <Date> <Time> <Type> <Component>: <Content>' input/mail.cup.com/auth.log 120
+"""
+import argparse
+import sys
+
+from logparser.utils.logreader import LogReader
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print lines of a log file by line number or LineId, counting from 1')
+    parser.add_argument('log', help='log file to read')
+    parser.add_argument('first', type=int, help='number of the first line to print')
+    parser.add_argument('last', type=int, nargs='?', help='number of the last line to print (default: first)')
+    parser.add_argument('--format', '-f', help='log format the log was parsed with, to number lines by LineId, counting only the lines that match it')
+    parser.add_argument('--non-ascii', help='with --format, replacement of non-ASCII characters the parser matched lines with (e.g. "<NASCII>" for Spell)')
+    parser.add_argument('--no-index', action='store_true', help='do not save the line indexes beside the log file')
+    args = parser.parse_args()
+
+    last = args.first if args.last is None else args.last
+    with LogReader(args.log, index_file=False if args.no_index else None, log_format=args.format,
+                   non_ascii=args.non_ascii) as reader:
+        try:
+            lines = reader.lines(args.first, last + 1)
+        except IndexError as e:
+            sys.exit(str(e))
+    for line in lines:
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ import pandas as pd
 from datetime import datetime
 from collections import defaultdict
 from functools import reduce
+from ..utils import logloader
 
 class Event():
     def __init__(self, logidx, Eventstr=""):
@@ -183,41 +184,14 @@ class LogParser():
 
 
     def log_to_dataframe(self, log_file, regex, headers, logformat):
-        ''' Function to transform log file to dataframe '''
-        log_messages = []
-        linecount = 0
-        with open(log_file, 'r') as fin:
-            for line in fin.readlines():
-                try:
-                    match = regex.search(line.strip())
-                    message = [match.group(header) for header in headers]
-                    log_messages.append(message)
-                    linecount += 1
-                except Exception as e:
-                    pass
-        logdf = pd.DataFrame(log_messages, columns=headers)
-        logdf.insert(0, 'LineId', None)
-        logdf['LineId'] = [i + 1 for i in range(linecount)]
-        return logdf
+        ''' Function to transform log file to dataframe
+        '''
+        return logloader.log_to_dataframe(log_file, regex, headers)
 
     def generate_logformat_regex(self, logformat):
-        ''' 
-        Function to generate regular expression to split log messages
-
+        ''' Function to generate regular expression to split log messages
         '''
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\s+', splitters[k])
-                regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+        return logloader.generate_logformat_regex(logformat)
 
     def get_parameter_list(self, row):
         template_regex = re.sub(r"<.{1,5}>", "<*>", row["EventTemplate"])
@@ -6,18 +6,57 @@ License     : MIT
 
 import regex as re
 import os
+import sys
+import csv
 import numpy as np
-import pandas as pd
 import hashlib
+import gzip
+import json
+import time
+import types
+import pickle
+import queue
+import multiprocessing as mp
+from array import array
+from collections import Counter, deque
 from datetime import datetime
+from ..utils.preprocessor import Preprocessor
+from ..utils import logloader
+
+# Version of the state files written by LogParser.save_state, to be increased whenever Node or Logcluster change
+STATE_VERSION = 3
+
+# Raw lines sent to a preprocessing worker at a time by LogParser.parseParallel
+PARALLEL_BATCH_SIZE = 5000
+
+# Stages timed when profiling, and the LogParser methods whose time counts towards each of them
+PROFILE_STAGES = [
+    ('load', ['iter_log', 'log_to_dataframe']),
+    ('preprocess', ['preprocess']),
+    ('tree_search', ['treeSearch']),
+    ('template_update', ['getTemplate']),
+    ('tree_insert', ['addSeqToPrefixTree']),
+    ('parameter_extraction', ['parameterRegex', 'extractParameters']),
+    ('output', ['outputResult', 'outputStream']),
+]
 
 
 class Logcluster:
-    def __init__(self, logTemplate='', logIDL=None):
+    def __init__(self, logTemplate=None, logIDL=None, clusterId=0, firstLogID=None):
+        # Template as an array of the token IDs interned by LogParser, where 0 is the <*> wildcard
+        if logTemplate is None:
+            logTemplate = array('i')
         self.logTemplate = logTemplate
         if logIDL is None:
             logIDL = []
         self.logIDL = logIDL
+        # Creation order, line of the first message, and number of messages of the cluster,
+        # which let the results be written without keeping every LineId in logIDL
+        self.clusterId = clusterId
+        self.firstLogID = firstLogID
+        self.occurrences = 0
+        # Leaf node the cluster was added to, whose token matrix must follow changes to the template
+        self.leaf = None
 
 
 class Node:
@@ -29,9 +68,54 @@ class Node:
         self.digitOrtoken = digitOrtoken
 
 
+class LeafClusters(list):
+    """ Log clusters of a leaf node, along with the matrix of their template token IDs that
+        LogParser.matrixMatch compares messages against, one row per cluster in list order
+    """
+    def __init__(self, clusters=()):
+        super().__init__(clusters)
+        self.matrix = None
+
+
+class StageTimer:
+    """ Wraps a method of LogParser to add the time spent in it, and the number of calls, to a stage of its profile
+        Generators are timed while they are iterated rather than when they are created
+    """
+    def __init__(self, timings, stage, function):
+        self.timings = timings
+        self.stage = stage
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.function(*args, **kwargs)
+        if isinstance(result, types.GeneratorType):
+            return self.iterate(result)
+        self.add(start, 1)
+        return result
+
+    def iterate(self, generator):
+        # Each item counts as a call
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                self.add(start, 0)
+                return
+            self.add(start, 1)
+            yield item
+
+    def add(self, start, calls):
+        timing = self.timings.setdefault(self.stage, [0.0, 0])
+        timing[0] += time.perf_counter() - start
+        timing[1] += calls
+
+
 class LogParser:
     def __init__(self, log_format, indir='./', outdir='./result/', depth=4, st=0.4, 
-                 maxChild=100, rex=[], keep_para=True):
+                 maxChild=100, rex=[], keep_para=True, state_file=None, leaf_matrix=32, n_workers=1,
+                 profile=False):
         """
         Attributes
         ----------
@@ -42,6 +126,15 @@ class LogParser:
             maxChild : max number of children of an internal node
             logName : the name of the input file containing raw log messages
             savePath : the output path stores the file containing structured logs
+            state_file : file the parse tree is saved to after parsing and loaded from before parsing, so that
+                         consecutive log chunks share their templates (default: None, start from an empty tree)
+            leaf_matrix : number of log clusters from which a leaf node compares a message with all its templates
+                          at once as a NumPy token matrix, rather than one by one (default: 32, None to never do so)
+            n_workers : number of processes parse_stream preprocesses lines with, and number of processes it builds
+                        the parse tree with, each taking the messages of some token counts (default: 1, parse serially)
+            profile : whether to time each stage of parsing and write the timings, along with statistics of the parse
+                      tree, to <logName>_profile.json next to the templates (default: False). With n_workers > 1, only
+                      the stages run by the main process are timed.
         """
         self.path = indir
         self.depth = depth - 2
@@ -52,7 +145,23 @@ class LogParser:
         self.df_log = None
         self.log_format = log_format
         self.rex = rex
+        self.preprocessor = Preprocessor(rex)
+        # Compiled regular expressions that extract the parameters of each template, see parameterRegex
+        self.parameterRegexes = {}
         self.keep_para = keep_para
+        self.state_file = state_file
+        self.leaf_matrix = leaf_matrix
+        self.n_workers = n_workers
+        self.profile = profile
+        # Seconds spent and number of calls for each stage in PROFILE_STAGES, filled in by StageTimer when profiling
+        self.timings = {}
+        if profile:
+            for stage, methods in PROFILE_STAGES:
+                for method in methods:
+                    setattr(self, method, StageTimer(self.timings, stage, getattr(self, method)))
+        # Tokens of the templates and their IDs, where 0 is reserved for the <*> wildcard
+        self.tokens = ['<*>']
+        self.tokenIds = {'<*>': 0}
 
     def hasNumbers(self, s):
         return any(char.isdigit() for char in s)
@@ -73,8 +182,8 @@ class LogParser:
 
             if token in parentn.childD:
                 parentn = parentn.childD[token]
-            elif '<*>' in parentn.childD:
-                parentn = parentn.childD['<*>']
+            elif 0 in parentn.childD:
+                parentn = parentn.childD[0]
             else:
                 return retLogClust
             currentDepth += 1
@@ -101,40 +210,43 @@ class LogParser:
             #Add current log cluster to the leaf node
             if currentDepth >= self.depth or currentDepth > seqLen:
                 if len(parentn.childD) == 0:
-                    parentn.childD = [logClust]
+                    parentn.childD = LeafClusters([logClust])
                 else:
                     parentn.childD.append(logClust)
+                    if parentn.childD.matrix is not None:
+                        parentn.childD.matrix = np.vstack([parentn.childD.matrix, logClust.logTemplate])
+                logClust.leaf = parentn.childD
                 break
 
             #If token not matched in this layer of existing tree. 
             if token not in parentn.childD:
-                if not self.hasNumbers(token):
-                    if '<*>' in parentn.childD:
+                if not self.hasNumbers(self.tokens[token]):
+                    if 0 in parentn.childD:
                         if len(parentn.childD) < self.maxChild:
-                            newNode = Node(depth=currentDepth + 1, digitOrtoken=token)
+                            newNode = Node(depth=currentDepth + 1, digitOrtoken=self.tokens[token])
                             parentn.childD[token] = newNode
                             parentn = newNode
                         else:
-                            parentn = parentn.childD['<*>']
+                            parentn = parentn.childD[0]
                     else:
                         if len(parentn.childD)+1 < self.maxChild:
-                            newNode = Node(depth=currentDepth+1, digitOrtoken=token)
+                            newNode = Node(depth=currentDepth+1, digitOrtoken=self.tokens[token])
                             parentn.childD[token] = newNode
                             parentn = newNode
                         elif len(parentn.childD)+1 == self.maxChild:
                             newNode = Node(depth=currentDepth+1, digitOrtoken='<*>')
-                            parentn.childD['<*>'] = newNode
+                            parentn.childD[0] = newNode
                             parentn = newNode
                         else:
-                            parentn = parentn.childD['<*>']
+                            parentn = parentn.childD[0]
             
                 else:
-                    if '<*>' not in parentn.childD:
+                    if 0 not in parentn.childD:
                         newNode = Node(depth=currentDepth+1, digitOrtoken='<*>')
-                        parentn.childD['<*>'] = newNode
+                        parentn.childD[0] = newNode
                         parentn = newNode
                     else:
-                        parentn = parentn.childD['<*>']
+                        parentn = parentn.childD[0]
 
             #If the token is matched
             else:
@@ -149,7 +261,7 @@ class LogParser:
         numOfPar = 0
 
         for token1, token2 in zip(seq1, seq2):
-            if token1 == '<*>':
+            if token1 == 0:
                 numOfPar += 1
                 continue
             if token1 == token2:
@@ -161,6 +273,9 @@ class LogParser:
 
 
     def fastMatch(self, logClustL, seq):
+        if self.leaf_matrix is not None and len(logClustL) >= self.leaf_matrix:
+            return self.matrixMatch(logClustL, seq)
+
         retLogClust = None
 
         maxSim = -1
@@ -179,51 +294,122 @@ class LogParser:
 
         return retLogClust
 
+    def internTokens(self, seq):
+        """ Function to map the tokens of a message to their IDs, assigning IDs to tokens seen for the first time
+        """
+        tokenIds = []
+        for token in seq:
+            tokenId = self.tokenIds.get(token)
+            if tokenId is None:
+                tokenId = self.tokenIds[token] = len(self.tokens)
+                self.tokens.append(token)
+            tokenIds.append(tokenId)
+        return tokenIds
+
+    def templateString(self, logTemplate):
+        return ' '.join([self.tokens[tokenId] for tokenId in logTemplate])
+
+    def leafMatrix(self, logClustL):
+        """ Function to return the token matrix of a leaf node, building it on first use
+        """
+        if logClustL.matrix is None:
+            logClustL.matrix = np.array([logClust.logTemplate for logClust in logClustL], dtype=np.int32)
+        return logClustL.matrix
+
+    def matrixMatch(self, logClustL, seq):
+        """ Function to find the most similar log cluster of a leaf node as fastMatch does, computing the
+            similarity and number of parameters of all its templates in one pass over the leaf's token matrix
+        """
+        matrix = self.leafMatrix(logClustL)
+        tokens = np.array(seq, dtype=np.int32)
+
+        wildcards = matrix == 0
+        simTokens = np.count_nonzero((matrix == tokens) & ~wildcards, axis=1)
+        numOfPar = np.count_nonzero(wildcards, axis=1)
+
+        # Ties in similarity go to the template with the most parameters, then to the first one, as in fastMatch
+        maxIdx = int(np.argmax(simTokens * (len(seq) + 1) + numOfPar))
+        if float(simTokens[maxIdx]) / len(seq) >= self.st:
+            return logClustL[maxIdx]
+        return None
+
     def getTemplate(self, seq1, seq2):
+        """ Function to merge a message (seq1) into a template (seq2) by replacing the tokens that differ with <*>
+            Returns the new template, or None if the template does not change
+        """
         assert len(seq1) == len(seq2)
-        retVal = []
-
-        i = 0
-        for word in seq1:
-            if word == seq2[i]:
-                retVal.append(word)
-            else:
-                retVal.append('<*>')
+        retVal = None
 
-            i += 1
+        for i, (word1, word2) in enumerate(zip(seq1, seq2)):
+            if word1 != word2 and word2 != 0:
+                if retVal is None:
+                    retVal = array('i', seq2)
+                retVal[i] = 0
 
         return retVal
 
     def outputResult(self, logClustL):
-        log_templates = [0] * self.df_log.shape[0]
-        log_templateids = [0] * self.df_log.shape[0]
-        df_events = []
-        for logClust in logClustL:
-            template_str = ' '.join(logClust.logTemplate)
-            occurrence = len(logClust.logIDL)
-            template_id = hashlib.md5(template_str.encode('utf-8')).hexdigest()[0:8]
-            for logID in logClust.logIDL:
-                logID -= 1
-                log_templates[logID] = template_str
-                log_templateids[logID] = template_id
-            df_events.append([template_id, template_str, occurrence])
-
-        df_event = pd.DataFrame(df_events, columns=['EventId', 'EventTemplate', 'Occurrences'])
-        self.df_log['EventId'] = log_templateids
-        self.df_log['EventTemplate'] = log_templates
-
-        if self.keep_para:
-            self.df_log["ParameterList"] = self.df_log.apply(self.get_parameter_list, axis=1) 
-        self.df_log.to_csv(os.path.join(self.savePath, self.logName + '_structured.csv'), index=False)
-
+        """ Function to write the results of parse, streaming the rows of df_log to _structured.csv along with the
+            template of their log cluster, and writing _templates.csv from the log clusters
+        """
+        clusterIds = np.zeros(self.df_log.shape[0], dtype=np.int64)
+        for clusterId, logClust in enumerate(logClustL):
+            clusterIds[np.asarray(logClust.logIDL, dtype=np.int64) - 1] = clusterId
 
-        occ_dict = dict(self.df_log['EventTemplate'].value_counts())
-        df_event = pd.DataFrame()
-        df_event['EventTemplate'] = self.df_log['EventTemplate'].unique()
-        df_event['EventId'] = df_event['EventTemplate'].map(lambda x: hashlib.md5(x.encode('utf-8')).hexdigest()[0:8])
-        df_event['Occurrences'] = df_event['EventTemplate'].map(occ_dict)
-        df_event.to_csv(os.path.join(self.savePath, self.logName + '_templates.csv'), index=False, columns=["EventId", "EventTemplate", "Occurrences"])
+        headers = list(self.df_log.columns[1:])
+        rows = zip(clusterIds.tolist(), *[self.df_log[column].tolist() for column in self.df_log.columns])
+        self.outputStructured(logClustL, rows, headers)
 
+    def outputProfile(self, rootNode, logCluL, lineCount, elapsed):
+        """ Function to write the stage timings of the last parse and statistics of the parse tree to
+            <logName>_profile.json, for tuning depth, st, and maxChild
+        """
+        total = elapsed.total_seconds()
+        timings = {stage: {'seconds': seconds, 'calls': calls} for stage, (seconds, calls) in self.timings.items()}
+        # Parameters are extracted while writing the output, so that time is only counted in its own stage
+        if 'output' in timings:
+            timings['csv_write'] = timings.pop('output')
+            timings['csv_write']['seconds'] -= timings.get('parameter_extraction', {'seconds': 0.0})['seconds']
+        timings['other'] = {'seconds': total - sum(timing['seconds'] for timing in timings.values())}
+
+        profile = {'log': self.logName,
+                   'lines': lineCount,
+                   'parameters': {'depth': self.depth + 2, 'st': self.st, 'maxChild': self.maxChild,
+                                  'n_workers': self.n_workers},
+                   'total_seconds': total,
+                   'lines_per_second': lineCount / total if total > 0 else None,
+                   'stages': timings,
+                   'tree': self.treeStats(rootNode, logCluL)}
+        with open(os.path.join(self.savePath, self.logName + '_profile.json'), 'w') as fout:
+            json.dump(profile, fout, indent=2)
+
+    def treeStats(self, rootNode, logCluL):
+        """ Function to count the nodes of the parse tree, the number of leaf nodes by size and depth, and the
+            number of log clusters by token count
+        """
+        internalNodes = 0
+        leafSizes = Counter()
+        leafDepths = Counter()
+        nodes = list(rootNode.childD.values())
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node.childD, LeafClusters):
+                leafSizes[len(node.childD)] += 1
+                leafDepths[node.depth] += 1
+            else:
+                internalNodes += 1
+                nodes.extend(node.childD.values())
+
+        leaves = sum(leafSizes.values())
+        return {'clusters': len(logCluL),
+                'internal_nodes': internalNodes,
+                'leaves': leaves,
+                'max_leaf_size': max(leafSizes) if leafSizes else 0,
+                'mean_leaf_size': sum(size * count for size, count in leafSizes.items()) / leaves if leaves else 0,
+                'leaf_sizes': {str(size): count for size, count in sorted(leafSizes.items())},
+                'leaf_depths': {str(depth): count for depth, count in sorted(leafDepths.items())},
+                'clusters_per_length': {str(seqLen): count for seqLen, count in
+                                        sorted(Counter(len(logClust.logTemplate) for logClust in logCluL).items())}}
 
     def printTree(self, node, dep):
         pStr = ''   
@@ -249,30 +435,14 @@ class LogParser:
         print('Parsing file: ' + os.path.join(self.path, logName))
         start_time = datetime.now()
         self.logName = logName
-        rootNode = Node()
-        logCluL = []
+        self.timings.clear()
+        rootNode, logCluL = self.load_state()
 
         self.load_data()
 
         count = 0
-        for idx, line in self.df_log.iterrows():
-            logID = line['LineId']
-            logmessageL = self.preprocess(line['Content']).strip().split()
-            # logmessageL = filter(lambda x: x != '', re.split('[\s=:,]', self.preprocess(line['Content'])))
-            matchCluster = self.treeSearch(rootNode, logmessageL)
-
-            #Match no existing log cluster
-            if matchCluster is None:
-                newCluster = Logcluster(logTemplate=logmessageL, logIDL=[logID])
-                logCluL.append(newCluster)
-                self.addSeqToPrefixTree(rootNode, newCluster)
-
-            #Add the new log message to the existing cluster
-            else:
-                newTemplate = self.getTemplate(logmessageL, matchCluster.logTemplate)
-                matchCluster.logIDL.append(logID)
-                if ' '.join(newTemplate) != ' '.join(matchCluster.logTemplate): 
-                    matchCluster.logTemplate = newTemplate
+        for lineId, content in logloader.iter_content(self.df_log):
+            self.addLine(rootNode, logCluL, lineId, content)
 
             count += 1
             if count % 1000 == 0 or count == len(self.df_log):
@@ -283,62 +453,479 @@ class LogParser:
             os.makedirs(self.savePath)
 
         self.outputResult(logCluL)
+        self.save_state(rootNode, logCluL)
+        if self.profile:
+            self.outputProfile(rootNode, logCluL, len(self.df_log), datetime.now() - start_time)
 
         print('Parsing done. [Time taken: {!s}]'.format(datetime.now() - start_time))
 
+    def addLine(self, rootNode, logCluL, logID, content, keepIDs=True):
+        """ Function to match one log message against the parse tree, either adding it to the most similar
+            log cluster or starting a new one, and return its log cluster
+            keepIDs : whether to record the LineId in the logIDL of the cluster
+        """
+        logmessageL = self.preprocess(content).strip().split()
+        # logmessageL = filter(lambda x: x != '', re.split('[\s=:,]', self.preprocess(content)))
+        return self.addTokens(rootNode, logCluL, logID, logmessageL, keepIDs)
+
+    def addTokens(self, rootNode, logCluL, logID, logmessageL, keepIDs=True):
+        """ Function to add the tokens of a preprocessed log message to the parse tree, as addLine does
+        """
+        # Tokens that appear in no template get an ID that matches nothing, so that they are only interned
+        # if they start a new template
+        getTokenId = self.tokenIds.get
+        seq = [getTokenId(token, -1) for token in logmessageL]
+        matchCluster = self.treeSearch(rootNode, seq)
+
+        #Match no existing log cluster
+        if matchCluster is None:
+            matchCluster = Logcluster(logTemplate=array('i', self.internTokens(logmessageL)), clusterId=len(logCluL),
+                                      firstLogID=logID)
+            logCluL.append(matchCluster)
+            self.addSeqToPrefixTree(rootNode, matchCluster)
+
+        #Add the new log message to the existing cluster
+        else:
+            newTemplate = self.getTemplate(seq, matchCluster.logTemplate)
+            if newTemplate is not None:
+                matchCluster.logTemplate = newTemplate
+                leaf = matchCluster.leaf
+                if leaf is not None and leaf.matrix is not None:
+                    leaf.matrix[leaf.index(matchCluster)] = newTemplate
+
+        if matchCluster.firstLogID is None:
+            matchCluster.firstLogID = logID
+        if keepIDs:
+            matchCluster.logIDL.append(logID)
+        matchCluster.occurrences += 1
+
+        return matchCluster
+
+    def stateParams(self):
+        """ Function to return the parameters a saved parse tree depends on, which must match to reuse it
+        """
+        return STATE_VERSION, self.depth, self.st, self.maxChild, list(self.rex)
+
+    def load_state(self, out=None):
+        """ Function to load the parse tree and log clusters saved by a previous parse from state_file
+
+            The clusters keep their templates, but their LineIds and occurrences are reset to count only the
+            lines of the current log file. Starts from an empty tree if there is no state_file, or if it was
+            saved with different parameters. Messages are printed to out (default: stdout).
+        """
+        if self.state_file is None or not os.path.exists(self.state_file):
+            return Node(), []
+
+        with gzip.open(self.state_file, 'rb') as fin:
+            state = pickle.load(fin)
+        if state['params'] != self.stateParams():
+            print('Ignoring parse tree in {0}, which was saved with different parameters'.format(self.state_file), file=out)
+            return Node(), []
+
+        self.tokens = state['tokens']
+        self.tokenIds = {token: tokenId for tokenId, token in enumerate(self.tokens)}
+        for logClust in state['clusters']:
+            logClust.logIDL = []
+            logClust.firstLogID = None
+            logClust.occurrences = 0
+
+        print('Loaded {0} templates from {1}'.format(len(state['clusters']), self.state_file), file=out)
+        return state['root'], state['clusters']
+
+    def save_state(self, rootNode, logCluL):
+        """ Function to save the parse tree and log clusters to state_file, for the next parse to start from
+        """
+        if self.state_file is None:
+            return
+
+        # The LineIds only belong to the current log file, and would make the state grow with every file
+        for logClust in logCluL:
+            logClust.logIDL = []
+
+        tmpPath = self.state_file + '.tmp'
+        with gzip.open(tmpPath, 'wb') as fout:
+            pickle.dump({'params': self.stateParams(), 'tokens': self.tokens, 'root': rootNode, 'clusters': logCluL}, fout,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, self.state_file)
+
+    def parse_stream(self, logName):
+        """ Function to parse a log file without loading it into a dataframe
+
+            Lines are read and matched against the parse tree one at a time, and each structured row is written
+            to a temporary file along with its log cluster as soon as it is parsed. Once all lines are parsed and the
+            templates are final, the temporary file is rewritten into the same _structured.csv and _templates.csv
+            files as parse, so memory use is bounded by the number of templates rather than the number of lines.
+        """
+        print('Parsing file: ' + os.path.join(self.path, logName))
+        start_time = datetime.now()
+        self.logName = logName
+        self.timings.clear()
+        rootNode, logCluL = self.load_state()
+
+        if not os.path.exists(self.savePath):
+            os.makedirs(self.savePath)
+
+        headers, regex = self.generate_logformat_regex(self.log_format)
+        contentIdx = headers.index('Content')
+        tmpPath = os.path.join(self.savePath, self.logName + '_structured.tmp')
+
+        count = 0
+        clusterIds = None
+        try:
+            with open(tmpPath, 'w', newline='', encoding='utf-8') as tmpFile:
+                writer = csv.writer(tmpFile, lineterminator='\n')
+                if self.n_workers > 1:
+                    count, clusterIds = self.parseParallel(rootNode, logCluL, regex, headers, writer)
+                else:
+                    for logID, message in self.iter_log(os.path.join(self.path, self.logName), regex, headers):
+                        logClust = self.addLine(rootNode, logCluL, logID, message[contentIdx], keepIDs=False)
+                        writer.writerow([logClust.clusterId, logID] + message)
+
+                        count += 1
+                        if count % 100000 == 0:
+                            print('Processed {0} log lines.'.format(count))
+
+            self.outputStream(logCluL, tmpPath, headers, clusterIds)
+        finally:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+        self.save_state(rootNode, logCluL)
+        if self.profile:
+            self.outputProfile(rootNode, logCluL, count, datetime.now() - start_time)
+
+        print('Processed {0} log lines.'.format(count))
+        print('Parsing done. [Time taken: {!s}]'.format(datetime.now() - start_time))
+
+    def parseParallel(self, rootNode, logCluL, regex, headers, writer):
+        """ Function to parse the log file of parse_stream with n_workers processes
+
+            Messages with different token counts never share a branch of the parse tree, so the tree is split by
+            token count into n_workers shards. A pool of processes matches the lines against the log format and
+            preprocesses them, in batches that are handed out in order, while each shard is built by its own process
+            from the messages of its token counts in LineId order. Afterwards, the shards are merged back into
+            rootNode and logCluL, with log clusters numbered in the order they were created, so the results are
+            identical to a serial parse. The rows are written without their log clusters, which are returned as
+            an array indexed by LineId - 1 along with the number of lines.
+        """
+        stateClusters = len(logCluL)
+        shardQueues = [mp.Queue(maxsize=2) for _ in range(self.n_workers)]
+        results = mp.Queue()
+        shards = [mp.Process(target=self.parseShard, args=(shard, rootNode, logCluL, shardQueues[shard], results))
+                  for shard in range(self.n_workers)]
+        for process in shards:
+            process.start()
+
+        try:
+            count = 0
+            pool = mp.Pool(self.n_workers, initializer=_initWorker, initargs=(self, regex, headers))
+            try:
+                pending = deque()
+                with open(os.path.join(self.path, self.logName), 'r') as fin:
+                    while True:
+                        lines = [line for _, line in zip(range(PARALLEL_BATCH_SIZE), fin)]
+                        if lines:
+                            pending.append(pool.apply_async(_preprocessBatch, (lines,)))
+                        # Keep a few batches in flight, so that the log file is never read far ahead of the shards
+                        while pending and (not lines or len(pending) > 2 * self.n_workers):
+                            count = self.dispatchBatch(pending.popleft().get(), count, writer, shardQueues, shards)
+                        if not lines:
+                            break
+            finally:
+                pool.terminate()
+
+            for shardQueue in shardQueues:
+                _put(shardQueue, None, shards)
+            shardResults = sorted(_get(results, shards) for _ in shards)
+            for process in shards:
+                process.join()
+        finally:
+            # After a failure, the shards would wait for messages forever and keep the interpreter from exiting
+            for shardQueue in shardQueues:
+                shardQueue.cancel_join_thread()
+            for process in shards:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        # Merge the shards, taking the log clusters loaded from state_file from the shard of their token count,
+        # and numbering the new log clusters by the line that created them
+        newClusters = []
+        for shard, subtree, clusters, tokens, _, _ in shardResults:
+            tokenMap = self.internTokens(tokens)
+            for seqLen, node in subtree.items():
+                self.remapNode(node, tokenMap)
+                rootNode.childD[seqLen] = node
+            for logClust in clusters:
+                logClust.logTemplate = array('i', [tokenMap[tokenId] for tokenId in logClust.logTemplate])
+                if logClust.clusterId < stateClusters:
+                    logCluL[logClust.clusterId] = logClust
+                else:
+                    newClusters.append(logClust)
+        newClusters.sort(key=lambda logClust: logClust.firstLogID)
+
+        shardClusterIds = [{} for _ in shards]
+        for clusterId, logClust in enumerate(logCluL + newClusters):
+            shardClusterIds[len(logClust.logTemplate) % self.n_workers][logClust.clusterId] = clusterId
+            logClust.clusterId = clusterId
+        logCluL.extend(newClusters)
+
+        clusterIds = np.zeros(count, dtype=np.int64)
+        for shard, _, _, _, logIDs, shardIds in shardResults:
+            idMap = shardClusterIds[shard]
+            clusterIds[np.frombuffer(logIDs, dtype=np.int64) - 1] = [idMap[clusterId] for clusterId in shardIds]
+        return count, clusterIds
+
+    def dispatchBatch(self, batch, count, writer, shardQueues, shards):
+        """ Function to number the lines of a preprocessed batch, write their rows, and send their messages to
+            the shards of their token counts, returning the number of lines so far
+        """
+        shardBatches = [[] for _ in shardQueues]
+        for message, content, seqLen in zip(*batch):
+            count += 1
+            writer.writerow([count] + message)
+            shardBatches[seqLen % len(shardQueues)].append((count, content))
+            if count % 100000 == 0:
+                print('Processed {0} log lines.'.format(count))
+
+        for shardQueue, shardBatch in zip(shardQueues, shardBatches):
+            if shardBatch:
+                _put(shardQueue, shardBatch, shards)
+        return count
+
+    def parseShard(self, shard, rootNode, logCluL, shardQueue, results):
+        """ Function run by the process of each shard of parseParallel, adding the messages it receives to its copy
+            of the parse tree and sending back its part of the tree, its log clusters, its token vocabulary, and
+            the shard-local clusterId of each LineId
+        """
+        logIDs = array('q')
+        clusterIds = []
+        for batch in iter(shardQueue.get, None):
+            for logID, content in batch:
+                logClust = self.addTokens(rootNode, logCluL, logID, content.split(), keepIDs=False)
+                logIDs.append(logID)
+                clusterIds.append(logClust.clusterId)
+
+        subtree = {seqLen: node for seqLen, node in rootNode.childD.items() if seqLen % self.n_workers == shard}
+        clusters = [logClust for logClust in logCluL if len(logClust.logTemplate) % self.n_workers == shard]
+        results.put((shard, subtree, clusters, self.tokens, logIDs.tobytes(), clusterIds))
+
+    def remapNode(self, node, tokenMap):
+        """ Function to change the token IDs in a branch of a parse tree built by another process to the IDs of
+            this parser's vocabulary, where tokenMap maps the IDs of the other process to those of this one
+        """
+        if isinstance(node.childD, LeafClusters):
+            node.childD.matrix = None
+            return
+        node.childD = {tokenMap[token]: child for token, child in node.childD.items()}
+        for child in node.childD.values():
+            self.remapNode(child, tokenMap)
+
+    def outputStream(self, logClustL, tmpPath, headers, clusterIds=None):
+        """ Function to write the results of parse_stream from its temporary file of rows and log clusters
+            clusterIds : log cluster of each LineId, if the rows were written without them by parseParallel
+        """
+        with open(tmpPath, 'r', newline='', encoding='utf-8') as tmpFile:
+            rows = csv.reader(tmpFile)
+            if clusterIds is not None:
+                rows = ([clusterIds[int(row[0]) - 1]] + row for row in rows)
+            self.outputStructured(logClustL, rows, headers)
+
+    def outputStructured(self, logClustL, rows, headers):
+        """ Function to write _structured.csv from rows of the log cluster, LineId, and header fields of each line,
+            followed by _templates.csv
+        """
+        templates = [self.templateString(logClust.logTemplate) for logClust in logClustL]
+        templateIds = [hashlib.md5(template.encode('utf-8')).hexdigest()[0:8] for template in templates]
+        contentIdx = headers.index('Content') + 1
+
+        columns = ['LineId'] + headers + ['EventId', 'EventTemplate']
+        if self.keep_para:
+            columns.append('ParameterList')
+            # The parameters of all lines of a cluster are extracted with the same compiled regular expression
+            templateRegexes = [self.parameterRegex(template) for template in templates]
+
+        with open(os.path.join(self.savePath, self.logName + '_structured.csv'), 'w', newline='', encoding='utf-8') as outFile:
+            writer = csv.writer(outFile, lineterminator='\n')
+            writer.writerow(columns)
+            for row in rows:
+                clusterId = int(row[0])
+                row = list(row[1:]) + [templateIds[clusterId], templates[clusterId]]
+                if self.keep_para:
+                    row.append(self.extractParameters(templateRegexes[clusterId], row[contentIdx]))
+                writer.writerow(row)
+
+        self.outputTemplates(logClustL)
+
+    def outputTemplates(self, logClustL):
+        """ Function to write the _templates.csv file straight from the log clusters
+
+            Clusters that ended up with the same template are counted as one event, and events are listed in
+            the order their first message appears in the log, as when the templates are taken from the structured log
+        """
+        events = {}
+        for logClust in logClustL:
+            if logClust.occurrences == 0:
+                continue
+            template = self.templateString(logClust.logTemplate)
+            firstLogID, occurrences = events.get(template, (logClust.firstLogID, 0))
+            events[template] = (min(firstLogID, logClust.firstLogID), occurrences + logClust.occurrences)
+
+        # Written to a temporary file first, so that readers never see a partial file while the service is running
+        outPath = os.path.join(self.savePath, self.logName + '_templates.csv')
+        with open(outPath + '.tmp', 'w', newline='', encoding='utf-8') as outFile:
+            writer = csv.writer(outFile, lineterminator='\n')
+            writer.writerow(['EventId', 'EventTemplate', 'Occurrences'])
+            for template, (_, occurrences) in sorted(events.items(), key=lambda event: event[1][0]):
+                writer.writerow([hashlib.md5(template.encode('utf-8')).hexdigest()[0:8], template, occurrences])
+        os.replace(outPath + '.tmp', outPath)
+
+    def open_stream(self, logName):
+        """ Function to start parsing log lines one at a time with parse_line, e.g., for a long-running service
+            logName : the name used for the _templates.csv file written by flush_stream
+        """
+        self.logName = logName
+        # Messages go to stderr, so that stdout only carries the records returned by parse_line
+        self.rootNode, self.logCluL = self.load_state(out=sys.stderr)
+        self.headers, self.regex = self.generate_logformat_regex(self.log_format)
+        self.lineCount = 0
+
+    def parse_line(self, line):
+        """ Function to parse a single raw log line against the live parse tree
+
+            Returns a dict with the LineId, EventId, EventTemplate, and (if keep_para is set) ParameterList of
+            the line, taken from the template as it is after the line was added, or None if the line does not
+            match the log format
+        """
+        match = self.regex.search(line.strip())
+        if match is None:
+            return None
+
+        self.lineCount += 1
+        content = match.group('Content')
+        logClust = self.addLine(self.rootNode, self.logCluL, self.lineCount, content, keepIDs=False)
+        template = self.templateString(logClust.logTemplate)
+        record = {'LineId': self.lineCount,
+                  'EventId': hashlib.md5(template.encode('utf-8')).hexdigest()[0:8],
+                  'EventTemplate': template}
+        if self.keep_para:
+            record['ParameterList'] = self.get_parameter_list({'EventTemplate': template, 'Content': content})
+        return record
+
+    def flush_stream(self):
+        """ Function to write the templates of the lines parsed so far by parse_line to _templates.csv,
+            and save the parse tree to state_file if one is set
+        """
+        if not os.path.exists(self.savePath):
+            os.makedirs(self.savePath)
+        self.outputTemplates(self.logCluL)
+        self.save_state(self.rootNode, self.logCluL)
+
     def load_data(self):
         headers, regex = self.generate_logformat_regex(self.log_format)
         self.df_log = self.log_to_dataframe(os.path.join(self.path, self.logName), regex, headers, self.log_format)
 
     def preprocess(self, line):
-        for currentRex in self.rex:
-            line = re.sub(currentRex, '<*>', line)
-        return line
+        return self.preprocessor(line)
 
-    def log_to_dataframe(self, log_file, regex, headers, logformat):
-        """ Function to transform log file to dataframe 
+    def iter_log(self, log_file, regex, headers):
+        """ Generator to read a log file line by line, yielding the LineId and header fields of each line
+            that matches the log format
         """
-        log_messages = []
         linecount = 0
         with open(log_file, 'r') as fin:
-            for line in fin.readlines():
-                try:
-                    match = regex.search(line.strip())
-                    message = [match.group(header) for header in headers]
-                    log_messages.append(message)
-                    linecount += 1
-                except Exception as e:
-                    pass
-        logdf = pd.DataFrame(log_messages, columns=headers)
-        logdf.insert(0, 'LineId', None)
-        logdf['LineId'] = [i + 1 for i in range(linecount)]
-        return logdf
+            for line in fin:
+                match = regex.search(line.strip())
+                if match is None:
+                    continue
+                linecount += 1
+                yield linecount, [match.group(header) for header in headers]
 
+    def log_to_dataframe(self, log_file, regex, headers, logformat):
+        """ Function to transform log file to dataframe
+        """
+        return logloader.log_to_dataframe(log_file, regex, headers)
 
     def generate_logformat_regex(self, logformat):
         """ Function to generate regular expression to split log messages
         """
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\\\s+', splitters[k])
-                regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+        return logloader.generate_logformat_regex(logformat)
+
+    def parameterRegex(self, template):
+        """ Function to return the compiled regular expression that extracts the parameters of a template,
+            or None if the template has none, building it only the first time the template is seen
+        """
+        if template in self.parameterRegexes:
+            return self.parameterRegexes[template]
+
+        template_regex = re.sub(r"<.{1,5}>", "<*>", template)
+        if "<*>" not in template_regex:
+            template_regex = None
+        else:
+            template_regex = re.sub(r'([^A-Za-z0-9])', r'\\\1', template_regex)
+            template_regex = re.sub(r'\\ +', r'\\s+', template_regex)
+            template_regex = re.compile("^" + template_regex.replace(r"\<\*\>", "(.*?)") + "$")
+        self.parameterRegexes[template] = template_regex
+        return template_regex
 
     def get_parameter_list(self, row):
-        template_regex = re.sub(r"<.{1,5}>", "<*>", row["EventTemplate"])
-        if "<*>" not in template_regex: return []
-        template_regex = re.sub(r'([^A-Za-z0-9])', r'\\\1', template_regex)
-        template_regex = re.sub(r'\\ +', r'\\s+', template_regex)
-        template_regex = "^" + template_regex.replace("\<\*\>", "(.*?)") + "$"
-        parameter_list = re.findall(template_regex, row["Content"])
+        return self.extractParameters(self.parameterRegex(row["EventTemplate"]), row["Content"])
+
+    def extractParameters(self, template_regex, content):
+        if template_regex is None: return []
+        parameter_list = template_regex.findall(content)
         parameter_list = parameter_list[0] if parameter_list else ()
         parameter_list = list(parameter_list) if isinstance(parameter_list, tuple) else [parameter_list]
-        return parameter_list
\ No newline at end of file
+        return parameter_list
+
+
+# Parser, log format regex, and headers of a preprocessing worker of LogParser.parseParallel
+_worker = None
+
+
+def _initWorker(parser, regex, headers):
+    global _worker
+    _worker = (parser, regex, headers)
+
+
+def _preprocessBatch(lines):
+    """ Matches a batch of raw lines against the log format and preprocesses their content, returning the header
+        fields, preprocessed content, and token count of the lines that match
+    """
+    parser, regex, headers = _worker
+    contentIdx = headers.index('Content')
+    messages, contents, seqLens = [], [], []
+    for line in lines:
+        match = regex.search(line.strip())
+        if match is None:
+            continue
+        message = [match.group(header) for header in headers]
+        content = parser.preprocess(message[contentIdx]).strip()
+        messages.append(message)
+        contents.append(content)
+        seqLens.append(len(content.split()))
+    return messages, contents, seqLens
+
+
+def _put(shardQueue, item, processes):
+    """ Puts an item on a queue read by worker processes, failing instead of blocking forever if any of them died
+    """
+    while True:
+        try:
+            shardQueue.put(item, timeout=1)
+            return
+        except queue.Full:
+            _checkAlive(processes)
+
+
+def _get(results, processes):
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            _checkAlive(processes)
+
+
+def _checkAlive(processes):
+    for process in processes:
+        if process.exitcode not in (None, 0):
+            raise RuntimeError('Drain worker process exited with code {0}'.format(process.exitcode))
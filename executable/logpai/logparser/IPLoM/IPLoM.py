@@ -13,6 +13,7 @@ import re
 import pandas as pd
 import hashlib
 import string
+from ..utils import logloader
 
 class Partition:
     """ Wrap around the logs and the step number
@@ -96,8 +97,7 @@ class LogParser:
         headers, regex = self.generate_logformat_regex(self.para.logformat)
         self.df_log = self.log_to_dataframe(os.path.join(self.para.path, self.logname), regex, headers, self.para.logformat)
         lineCount = 1
-        for idx, line in self.df_log.iterrows():
-            line = line['Content']
+        for _, line in logloader.iter_content(self.df_log):
             # If line is empty, skip
             if line.strip() == "":
                 continue
@@ -588,40 +588,14 @@ class LogParser:
                 print (event.eventStr)
 
     def log_to_dataframe(self, log_file, regex, headers, logformat):
-        """ Function to transform log file to dataframe 
+        """ Function to transform log file to dataframe
         """
-        log_messages = []
-        linecount = 0
-        with open(log_file, 'r') as fin:
-            for line in fin.readlines():
-                try:
-                    match = regex.search(line.strip())
-                    message = [match.group(header) for header in headers]
-                    log_messages.append(message)
-                    linecount += 1
-                except Exception as e:
-                    pass
-        logdf = pd.DataFrame(log_messages, columns=headers)
-        logdf.insert(0, 'LineId', None)
-        logdf['LineId'] = [i + 1 for i in range(linecount)]
-        return logdf
+        return logloader.log_to_dataframe(log_file, regex, headers)
 
     def generate_logformat_regex(self, logformat):
         """ Function to generate regular expression to split log messages
         """
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\s+', splitters[k])
-                regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+        return logloader.generate_logformat_regex(logformat)
 
     def get_parameter_list(self, row):
         template_regex = re.sub(r"\s<.{1,5}>\s", "<*>", row["EventTemplate"])
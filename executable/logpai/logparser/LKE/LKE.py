@@ -13,6 +13,7 @@ import sys
 import pandas as pd
 import hashlib
 import numpy as np
+from ..utils import logloader
 
 SAVEDISTANCE = True
 
@@ -192,9 +193,9 @@ class LogParser:
                     content_event[content] = template
 
         Templates = []
-        for idx, line in self.df_log.iterrows():
-            processed = self.preprocess(line['Content'])
-            Templates.append(content_event[processed] if processed in content_event else line['Content'])
+        for _, content in logloader.iter_content(self.df_log):
+            processed = self.preprocess(content)
+            Templates.append(content_event[processed] if processed in content_event else content)
 
         self.df_log['EventTemplate'] = Templates
         self.df_log['EventId'] = self.df_log['EventTemplate'].map(lambda x: hashlib.md5(x.encode('utf-8')).hexdigest()[0:8])
@@ -212,41 +213,14 @@ class LogParser:
             os.remove(self.para.savePath+self.logname+'distArray.csv')
 
     def log_to_dataframe(self, log_file, regex, headers, logformat):
-        ''' Function to transform log file to dataframe '''
-        log_messages = []
-        linecount = 0
-        with open(log_file, 'r') as fin:
-            for line in fin.readlines():
-                try:
-                    match = regex.search(line.strip())
-                    message = [match.group(header) for header in headers]
-                    log_messages.append(message)
-                    linecount += 1
-                except Exception as e:
-                    pass
-        logdf = pd.DataFrame(log_messages, columns=headers)
-        logdf.insert(0, 'LineId', None)
-        logdf['LineId'] = [i + 1 for i in range(linecount)]
-        return logdf
-
+        ''' Function to transform log file to dataframe
+        '''
+        return logloader.log_to_dataframe(log_file, regex, headers)
 
     def generate_logformat_regex(self, logformat):
-        ''' 
-        Function to generate regular expression to split log messages
+        ''' Function to generate regular expression to split log messages
         '''
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\s+', splitters[k])
-                regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+        return logloader.generate_logformat_regex(logformat)
 
 
     def parse(self, logname):
@@ -11,6 +11,7 @@ import os
 import hashlib
 from collections import defaultdict
 from datetime import datetime
+from ..utils import logloader
 
 class LogParser(object):
     def __init__(self, indir, outdir, log_format, threshold=0.9, predefined_templates=None, rex=[]):
@@ -30,8 +31,7 @@ class LogParser(object):
         starttime = datetime.now()
         headers, regex = self.generate_logformat_regex(self.logformat)
         self.df_log = self.log_to_dataframe(os.path.join(self.path, self.logname), regex, headers, self.logformat)
-        for idx, line in self.df_log.iterrows():
-            line = line['Content']
+        for idx, (_, line) in enumerate(logloader.iter_content(self.df_log)):
             if self.rex:
                 for currentRex in self.rex:
                     line = re.sub(currentRex, '<*>', line)
@@ -64,37 +64,11 @@ class LogParser(object):
 
 
     def log_to_dataframe(self, log_file, regex, headers, logformat):
-        ''' Function to transform log file to dataframe '''
-        log_messages = []
-        linecount = 0
-        with open(log_file, 'r') as fin:
-            for line in fin.readlines():
-                try:
-                    match = regex.search(line.strip())
-                    message = [match.group(header) for header in headers]
-                    log_messages.append(message)
-                    linecount += 1
-                except Exception as e:
-                    pass
-        logdf = pd.DataFrame(log_messages, columns=headers)
-        logdf.insert(0, 'LineId', None)
-        logdf['LineId'] = [i + 1 for i in range(linecount)]
-        return logdf
+        ''' Function to transform log file to dataframe
+        '''
+        return logloader.log_to_dataframe(log_file, regex, headers)
 
     def generate_logformat_regex(self, logformat):
-        ''' 
-        Function to generate regular expression to split log messages
+        ''' Function to generate regular expression to split log messages
         '''
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\s+', splitters[k])
-                regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+        return logloader.generate_logformat_regex(logformat)
@@ -13,6 +13,7 @@ import re
 import os
 import pandas as pd
 import hashlib
+from ..utils import logloader
 
 
 class Para:
@@ -43,8 +44,7 @@ class LogParser:
         headers, regex = self.generate_logformat_regex(self.para.logformat)
         self.df_log = self.log_to_dataframe(os.path.join(self.para.path, self.logname), regex, headers,
                                             self.para.logformat)
-        for idx, line in self.df_log.iterrows():
-            line = line['Content']
+        for _, line in logloader.iter_content(self.df_log):
             if self.para.rex:
                 for currentRex in self.para.rex:
                     line = re.sub(currentRex, '', line)
@@ -225,40 +225,14 @@ class LogParser:
         df_event.to_csv(os.path.join(self.para.savePath, self.logname + '_templates.csv'), index=False, columns=["EventId", "EventTemplate","Occurrences"])
 
     def log_to_dataframe(self, log_file, regex, headers, logformat):
-        """ Function to transform log file to dataframe """
-        log_messages = []
-        linecount = 0
-        with open(log_file, 'r') as fin:
-            for line in fin.readlines():
-                try:
-                    match = regex.search(line.strip())
-                    message = [match.group(header) for header in headers]
-                    log_messages.append(message)
-                    linecount += 1
-                except Exception as e:
-                    pass
-        logdf = pd.DataFrame(log_messages, columns=headers)
-        logdf.insert(0, 'LineId', None)
-        logdf['LineId'] = [i + 1 for i in range(linecount)]
-        return logdf
+        """ Function to transform log file to dataframe
+        """
+        return logloader.log_to_dataframe(log_file, regex, headers)
 
     def generate_logformat_regex(self, logformat):
-        """ 
-        Function to generate regular expression to split log messages
+        """ Function to generate regular expression to split log messages
         """
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\s+', splitters[k])
-                regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+        return logloader.generate_logformat_regex(logformat)
 
     def parse(self, logname):
         print('Parsing file: ' + os.path.join(self.para.path, logname))
@@ -13,6 +13,7 @@ import numpy as np
 import pandas as pd
 import hashlib
 from datetime import datetime
+from ..utils import logloader
 
 class Node:
     def __init__(self, format='', logIDL=None, childL=None):
@@ -348,9 +349,7 @@ class LogParser:
         self.load_data()
 
         count = 0
-        for idx, line in self.df_log.iterrows():
-            ID = line['LineId']
-            logmessageL = line['Content']
+        for ID, logmessageL in logloader.iter_content(self.df_log):
             if self.rex:
                 for currentRex in self.rex:
                     logmessageL = re.sub(currentRex, '<*>', logmessageL)
@@ -377,40 +376,12 @@ class LogParser:
 
 
     def log_to_dataframe(self, log_file, regex, headers, logformat):
-        ''' 
-        Function to transform log file to dataframe 
+        ''' Function to transform log file to dataframe
         '''
-        log_messages = []
-        linecount = 0
-        with open(log_file, 'r') as fin:
-            for line in fin.readlines():
-                try:
-                    match = regex.search(line.strip())
-                    message = [match.group(header) for header in headers]
-                    log_messages.append(message)
-                    linecount += 1
-                except Exception as e:
-                    pass
-        logdf = pd.DataFrame(log_messages, columns=headers)
-        logdf.insert(0, 'LineId', None)
-        logdf['LineId'] = [i + 1 for i in range(linecount)]
-        return logdf
+        return logloader.log_to_dataframe(log_file, regex, headers)
 
     def generate_logformat_regex(self, logformat):
-        ''' 
-        Function to generate regular expression to split log messages
+        ''' Function to generate regular expression to split log messages
         '''
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\s+', splitters[k])
-                regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+        return logloader.generate_logformat_regex(logformat)
 
@@ -13,6 +13,7 @@ from datetime import datetime
 from ..logmatch import regexmatch
 import subprocess
 import os
+from ..utils import logloader
 
 
 class LogParser(object):
@@ -81,11 +82,11 @@ def SLCT(para, log_format, rex):
     os.remove("slct_templates.txt")
     os.remove("temp_templates.csv")
 
-    for idx, line in matched_df.iterrows():
-        if line['EventTemplate'] == "None":
-            content = line['Content']
-            matched_df.loc[idx, "EventTemplate"] = content
-            matched_df.loc[idx, "EventId"] = hashlib.md5(content.encode('utf-8')).hexdigest()[0:8]
+    # Lines that match no template are their own template
+    unmatched = matched_df['EventTemplate'] == "None"
+    contents = matched_df.loc[unmatched, 'Content']
+    matched_df.loc[unmatched, "EventTemplate"] = contents
+    matched_df.loc[unmatched, "EventId"] = contents.map(lambda content: hashlib.md5(content.encode('utf-8')).hexdigest()[0:8])
 
     occ_dict = dict(matched_df['EventTemplate'].value_counts())
     df_event = pd.DataFrame()
@@ -109,40 +110,14 @@ def extract_command(para, logname):
     return input
 
 def log_to_dataframe(log_file, regex, headers, logformat):
-    ''' Function to transform log file to dataframe '''
-    log_messages = []
-    linecount = 0
-    with open(log_file, 'r') as fin:
-        for line in fin.readlines():
-            try:
-                match = regex.search(line.strip())
-                message = [match.group(header) for header in headers]
-                log_messages.append(message)
-                linecount += 1
-            except Exception as e:
-                pass
-    logdf = pd.DataFrame(log_messages, columns=headers)
-    logdf.insert(0, 'LineId', None)
-    logdf['LineId'] = [i + 1 for i in range(linecount)]
-    return logdf
+    ''' Function to transform log file to dataframe
+    '''
+    return logloader.log_to_dataframe(log_file, regex, headers)
 
 def generate_logformat_regex(logformat):
-    ''' 
-    Function to generate regular expression to split log messages
+    ''' Function to generate regular expression to split log messages
     '''
-    headers = []
-    splitters = re.split(r'(<[^<>]+>)', logformat)
-    regex = ''
-    for k in range(len(splitters)):
-        if k % 2 == 0:
-            splitter = re.sub(' +', '\s+', splitters[k])
-            regex += splitter
-        else:
-            header = splitters[k].strip('<').strip('>')
-            regex += '(?P<%s>.*?)' % header
-            headers.append(header)
-    regex = re.compile('^' + regex + '$')
-    return headers, regex
+    return logloader.generate_logformat_regex(logformat)
 
 class TempPara:
     def __init__(self, path='./', logname='rawlog.log', savePath='./', templateName='slct_templates.txt', outlierName='slct_outliers.log'):
@@ -12,6 +12,7 @@ import pandas as pd
 import hashlib
 from datetime import datetime
 import string
+from ..utils import logloader
 
 
 class LCSObject:
@@ -233,9 +234,8 @@ class LogParser:
         logCluL = []
 
         count = 0
-        for idx, line in self.df_log.iterrows():
-            logID = line['LineId']
-            logmessageL = list(filter(lambda x: x != '', re.split(r'[\s=:,]', self.preprocess(line['Content']))))
+        for logID, content in logloader.iter_content(self.df_log):
+            logmessageL = list(filter(lambda x: x != '', re.split(r'[\s=:,]', self.preprocess(content))))
             constLogMessL = [w for w in logmessageL if w != '<*>']
 
             #Find an existing matched log cluster
@@ -282,41 +282,14 @@ class LogParser:
         return line
 
     def log_to_dataframe(self, log_file, regex, headers, logformat):
-        """ Function to transform log file to dataframe 
+        """ Function to transform log file to dataframe
         """
-        log_messages = []
-        linecount = 0
-        with open(log_file, 'r') as fin:
-            for line in fin.readlines():
-                line = re.sub(r'[^\x00-\x7F]+', '<NASCII>', line)
-                try:
-                    match = regex.search(line.strip())
-                    message = [match.group(header) for header in headers]
-                    log_messages.append(message)
-                    linecount += 1
-                except Exception as e:
-                    pass
-        logdf = pd.DataFrame(log_messages, columns=headers)
-        logdf.insert(0, 'LineId', None)
-        logdf['LineId'] = [i + 1 for i in range(linecount)]
-        return logdf
+        return logloader.log_to_dataframe(log_file, regex, headers, non_ascii='<NASCII>')
 
     def generate_logformat_regex(self, logformat):
         """ Function to generate regular expression to split log messages
         """
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\s+', splitters[k])
-                regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+        return logloader.generate_logformat_regex(logformat)
 
     def get_parameter_list(self, row):
         template_regex = re.sub(r"\s<.{1,5}>\s", "<*>", row["EventTemplate"])
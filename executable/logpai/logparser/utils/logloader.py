@@ -22,13 +22,21 @@
 """ This file implements the formating interface to load log file to dataframe
 """
 
-import sys
+import io
+import os
+import time
 import pandas as pd
 import re
 import multiprocessing as mp
-from itertools import groupby, count, chain
+from collections import deque
 import numpy as np
 
+# Size in bytes of the blocks of lines read at a time by log_to_dataframe, and of the byte ranges of the file that
+# workers read and match on their own when loading with several processes
+CHUNK_SIZE = 1 << 22
+
+NON_ASCII = re.compile(r'[^\x00-\x7F]+')
+
 class LogLoader(object):
 
     def __init__(self, logformat, n_workers=1):
@@ -42,48 +50,222 @@ class LogLoader(object):
         """ Function to transform log file to dataframe 
         """
         print('Loading log messages to dataframe...')
-        lines = []
-        with open(log_filepath, 'r') as fid:
-            lines = fid.readlines()
-        
-        log_messages = []
         if self.n_workers == 1: 
+            lines = []
+            with open(log_filepath, 'r') as fid:
+                lines = fid.readlines()
             log_messages = formalize_message(enumerate(lines), self.regex, self.headers)
+            lineCount = len(lines)
+            log_dataframe = pd.DataFrame(log_messages, columns=['LineId'] + self.headers)
         else:
-            chunk_size = np.ceil(len(lines) / float(self.n_workers))
-            chunks = groupby(enumerate(lines), key=lambda k, line=count(): next(line)//chunk_size)
-            log_chunks = [list(chunk) for _, chunk in chunks]
-            print('Read %d log chunks in parallel'%len(log_chunks))
-            pool = mp.Pool(processes=self.n_workers)
-            result_chunks = [pool.apply_async(formalize_message, args=(chunk, self.regex, self.headers))
-                             for chunk in log_chunks]
-            pool.close()
-            pool.join()
-            log_messages = list(chain(*[result.get() for result in result_chunks]))
-
-        if not log_messages:
+            # Workers read and match byte ranges of the file themselves, and send back only the columns of the
+            # lines that match, with line numbers counted from the start of their range
+            ranges = byte_ranges(log_filepath, CHUNK_SIZE)
+            lineCount = 0
+            lineIds = []
+            columns = [[] for _ in self.headers]
+            # The pool is terminated on leaving the block, also if a worker fails
+            with mp.Pool(processes=self.n_workers) as pool:
+                results = ordered_map(pool, formalize_range,
+                                      ((log_filepath, start, end, self.regex, self.headers) for start, end in ranges),
+                                      self.n_workers)
+                for rangeLines, rangeLineIds, rangeColumns in results:
+                    lineIds.append(rangeLineIds + lineCount)
+                    lineCount += rangeLines
+                    for column, rangeColumn in zip(columns, rangeColumns):
+                        column.extend(rangeColumn)
+            log_dataframe = pd.DataFrame(dict(zip(self.headers, columns)), columns=self.headers)
+            log_dataframe.insert(0, 'LineId', np.concatenate(lineIds) if lineIds else np.empty(0, dtype=np.int64))
+
+        if log_dataframe.empty:
             raise RuntimeError('Logformat error or log file is empty!')
-        log_dataframe = pd.DataFrame(log_messages, columns=['LineId'] + self.headers)
-        success_rate = len(log_messages) / float(len(lines))
-        print('Loading {} messages done, loading rate: {:.1%}'.format(len(log_messages), success_rate))
+        success_rate = len(log_dataframe) / float(lineCount)
+        print('Loading {} messages done, loading rate: {:.1%}'.format(len(log_dataframe), success_rate))
         return log_dataframe
 
     def _generate_logformat_regex(self, logformat):
         """ Function to generate regular expression to split log messages
         """
-        headers = []
-        splitters = re.split(r'(<[^<>]+>)', logformat)
-        regex = ''
-        for k in range(len(splitters)):
-            if k % 2 == 0:
-                splitter = re.sub(' +', '\s+', splitters[k])
+        return generate_logformat_regex(logformat)
+
+
+def generate_logformat_regex(logformat):
+    """ Function to generate regular expression to split log messages
+
+        The regular expression puts each header field in a lazy group, which backtracks a lot on long lines. The
+        LogFormatRegex returned matches lines the same way through a tighter expression first, and only falls back to
+        the lazy expression for the lines it does not match
+    """
+    regex = LogFormatRegex(logformat)
+    return regex.headers, regex
+
+
+def logformat_regex(splitters, tight=False):
+    """ Function to build the regular expression of a log format split into literal parts and header fields
+
+        tight : if set, header fields other than the last only match non-whitespace characters, greedily when
+                whitespace follows them, and each is matched together with the literal part after it only once, as
+                the first match of a lookahead, so that the expression never backtracks into an earlier field. The
+                last field is greedy when the literal part after it has a fixed length
+    """
+    regex = ''
+    lastField = len(splitters) - 2
+    for k in range(len(splitters)):
+        if k % 2 == 0:
+            splitter = re.sub(' +', r'\\s+', splitters[k])
+            if tight and k == 0 and splitter and lastField > 0:
+                regex += '(?=(?P<_logformat0>%s))(?P=_logformat0)' % splitter
+            elif not tight or k == 0 or k > lastField:
                 regex += splitter
-            else:
-                header = splitters[k].strip('<').strip('>')
-                regex += '(?P<%s>.*?)' % header
-                headers.append(header)
-        regex = re.compile('^' + regex + '$')
-        return headers, regex
+            continue
+
+        header = splitters[k].strip('<').strip('>')
+        if not tight:
+            regex += '(?P<%s>.*?)' % header
+        elif k == lastField:
+            # Before a literal part of fixed length, only one end of the last field lets the line match
+            fixed = re.match(r'(?:\\[^0-9A-Za-z\s]|[^\\.^$*+?{}\[\]|()\s])*$', splitters[k + 1])
+            regex += '(?P<%s>%s)' % (header, '.*' if fixed else '.*?')
+        else:
+            field = '\\S*' if splitters[k + 1].startswith(' ') else '\\S*?'
+            splitter = re.sub(' +', r'\\s+', splitters[k + 1])
+            regex += '(?=(?P<_logformat{0}>(?P<{1}>{2}){3}))(?P=_logformat{0})'.format(k, header, field, splitter)
+    return re.compile('^' + regex + '$')
+
+
+class LogFormatRegex(object):
+    """ Matches log lines against a log format, giving the same header fields as the lazy regular expression of the
+        log format, with a search method and match objects like those of a compiled regular expression
+
+        Lines are first matched with a tighter regular expression that tries the same fields in the same order as
+        the lazy one, but only those without whitespace, and never goes back to an earlier field once the next one
+        fails. When it matches a line, the lazy expression finds the same fields first. Only the lines it does not
+        match, usually those with fields that hold whitespace, are matched with the lazy expression.
+    """
+    def __init__(self, logformat):
+        self.logformat = logformat
+        splitters = re.split(r'(<[^<>]+>)', logformat)
+        self.headers = [splitters[k].strip('<').strip('>') for k in range(1, len(splitters), 2)]
+        self.full = logformat_regex(splitters)
+        self.tight = logformat_regex(splitters, tight=True)
+        self.pattern = self.full.pattern
+
+    def search(self, line):
+        return self.tight.match(line) or self.full.search(line)
+
+
+def log_to_dataframe(log_file, regex, headers, n_workers=1, non_ascii=None):
+    """ Function to transform log file to dataframe, shared by the log parsers
+
+        The file is read CHUNK_SIZE bytes of lines at a time, and the columns of the dataframe are built straight from
+        the lines that match the log format, numbered from 1 by LineId. Lines that do not match are skipped.
+        n_workers : number of processes to match the file with. Each worker reads and matches byte ranges of the file
+                    itself, so that only the matched columns are passed between processes
+        non_ascii : if set, runs of non-ASCII characters are replaced with it before matching
+    """
+    start_time = time.time()
+    columns = [[] for _ in headers]
+    lineCount = 0
+    if n_workers > 1:
+        # The pool is terminated on leaving the block, also if a worker fails
+        with mp.Pool(processes=n_workers) as pool:
+            results = ordered_map(pool, match_range, ((log_file, start, end, regex, headers, non_ascii)
+                                                      for start, end in byte_ranges(log_file, CHUNK_SIZE)), n_workers)
+            for chunkLines, chunkColumns in results:
+                lineCount += chunkLines
+                for column, chunkColumn in zip(columns, chunkColumns):
+                    column.extend(chunkColumn)
+    else:
+        with open(log_file, 'r') as fin:
+            for chunk in iter(lambda: fin.readlines(CHUNK_SIZE), []):
+                chunkLines, chunkColumns = match_lines(chunk, regex, headers, non_ascii)
+                lineCount += chunkLines
+                for column, chunkColumn in zip(columns, chunkColumns):
+                    column.extend(chunkColumn)
+
+    logdf = pd.DataFrame(dict(zip(headers, columns)), columns=headers)
+    logdf.insert(0, 'LineId', np.arange(1, len(logdf) + 1))
+    elapsed = time.time() - start_time
+    print('Loaded {0} of {1} log lines in {2:.2f}s ({3:.0f} lines/s)'.format(
+        len(logdf), lineCount, elapsed, lineCount / elapsed if elapsed > 0 else float('inf')))
+    return logdf
+
+
+def iter_content(df_log):
+    """ Function to iterate over the LineId and Content of each line of a log dataframe, reading them from the arrays
+        of the two columns instead of building a Series for every row as DataFrame.iterrows does
+    """
+    return zip(df_log['LineId'].tolist(), df_log['Content'].tolist())
+
+
+def match_lines(lines, regex, headers, non_ascii=None):
+    """ Function to match lines against the regular expression of a log format, returning the number of lines and the
+        columns of the header fields of the lines that match
+    """
+    rows = []
+    search = regex.search
+    for line in lines:
+        if non_ascii is not None:
+            line = NON_ASCII.sub(non_ascii, line)
+        match = search(line.strip())
+        if match is not None:
+            rows.append(match.group(*headers) if len(headers) > 1 else (match.group(headers[0]),))
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in headers]
+    return len(lines), columns
+
+
+def byte_ranges(log_file, size):
+    """ Generator to split a file into (start, end) byte ranges of about size bytes, each ending just after a newline
+        or at the end of the file, so that every range holds whole lines
+    """
+    fileSize = os.path.getsize(log_file)
+    with open(log_file, 'rb') as fin:
+        start = 0
+        while start < fileSize:
+            fin.seek(min(start + size, fileSize) - 1)
+            fin.readline()
+            end = min(fin.tell(), fileSize)
+            yield start, end
+            start = end
+
+
+def read_range(log_file, start, end):
+    """ Function to read the lines in a byte range of a file, decoded and split as reading the file in text mode does
+    """
+    with open(log_file, 'rb') as fin:
+        fin.seek(start)
+        data = fin.read(end - start)
+    return io.TextIOWrapper(io.BytesIO(data)).readlines()
+
+
+def match_range(log_file, start, end, regex, headers, non_ascii=None):
+    """ Function to match the lines in a byte range of a file, as match_lines does for lines already read
+    """
+    return match_lines(read_range(log_file, start, end), regex, headers, non_ascii)
+
+
+def formalize_range(log_file, start, end, regex, headers):
+    """ Function to formalize the lines in a byte range of a file, returning the number of lines, the line numbers
+        of the lines that match counted from 1 at the start of the range, and the columns of their header fields
+    """
+    lines = read_range(log_file, start, end)
+    log_messages = formalize_message(enumerate(lines), regex, headers)
+    lineIds = np.array([message[0] for message in log_messages], dtype=np.int64)
+    columns = [list(column) for column in zip(*log_messages)][1:] if log_messages else [[] for _ in headers]
+    return len(lines), lineIds, columns
+
+
+def ordered_map(pool, function, argsL, n_workers):
+    """ Generator to apply function to each tuple of arguments in a pool, yielding the results in order while
+        keeping only a few tasks in flight, so that the arguments are not all read into memory ahead of the workers
+    """
+    pending = deque()
+    for args in argsL:
+        pending.append(pool.apply_async(function, args))
+        if len(pending) > 2 * n_workers:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
 
 
 def formalize_message(enumerated_lines, regex, headers):
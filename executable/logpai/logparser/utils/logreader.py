@@ -0,0 +1,228 @@
+""" This file implements a memory-mapped reader of log files, with an index of the offsets of their lines for
+    random access by line number or LineId
+"""
+
+import hashlib
+import locale
+import mmap
+import os
+
+import numpy as np
+
+from . import logloader
+
+# Suffix of the line index persisted beside a log file
+INDEX_SUFFIX = '.lineidx.npy'
+
+# Suffix of the LineId index persisted beside a log file, for the log format whose hash it holds
+LINEID_SUFFIX = '.lineid-{0}.npy'
+
+# Size in bytes of the blocks of the file scanned for newlines at a time when building the index
+INDEX_BLOCK_SIZE = 1 << 24
+
+
+class LogReader(object):
+    """ Reads the lines of a log file through a memory map, using an index of the byte offset at which every line
+        starts, so that any line or range of lines is found in constant time without reading the file before it
+
+        Lines end at a newline, a carriage return and newline, or a lone carriage return, as when reading the file in
+        text mode, and are returned without it. They are numbered from 1, or by LineId if the log format the file
+        was parsed with is given, counting only the lines that match it as the log parsers do. The line index is an
+        int64 array holding the offset of each line followed by the size of the file, and is saved to
+        <log_file>.lineidx.npy the first time the file is read, then reused as long as the file has not changed.
+        The LineId index holds the number of the line of each LineId followed by the number of lines, and is saved
+        the same way to <log_file>.lineid-<hash of the log format>.npy.
+
+        log_file : path of the log file
+        index_file : path to save the line index to and load it from (default: <log_file>.lineidx.npy), or False to
+                     build both indexes in memory only
+        encoding : encoding to decode lines with (default: the same as open)
+        log_format : log format the file was parsed with, to number lines by LineId
+        non_ascii : if set, runs of non-ASCII characters are replaced with it before matching the log format, as the
+                    log parsers that pass it to logloader.log_to_dataframe do
+    """
+    def __init__(self, log_file, index_file=None, encoding=None, log_format=None, non_ascii=None):
+        self.log_file = log_file
+        self.index_file = log_file + INDEX_SUFFIX if index_file is None else index_file
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.fid = open(log_file, 'rb')
+        size = os.fstat(self.fid.fileno()).st_size
+        # Empty files cannot be memory mapped
+        self.data = mmap.mmap(self.fid.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.offsets = self.loadIndex()
+        if self.offsets is None:
+            self.offsets = self.buildIndex()
+            self.saveIndex()
+
+        self.lineIds = None
+        if log_format is not None:
+            key = hashlib.md5(repr((log_format, non_ascii)).encode('utf-8')).hexdigest()[0:8]
+            self.lineId_file = log_file + LINEID_SUFFIX.format(key) if self.index_file else False
+            self.lineIds = self.loadLineIds()
+            if self.lineIds is None:
+                self.lineIds = self.buildLineIds(log_format, non_ascii)
+                self.saveLineIds()
+
+    def __len__(self):
+        return len(self.offsets) - 1 if self.lineIds is None else len(self.lineIds) - 1
+
+    def __iter__(self):
+        """ Generator to yield every line of the file, or every line with a LineId, as a memoryview of the memory
+            map, without copying it
+        """
+        view = memoryview(self.data)
+        offsets = self.offsets.tolist()
+        numbers = range(len(offsets) - 1) if self.lineIds is None else self.lineIds[:-1].tolist()
+        for idx in numbers:
+            yield _strip(view[offsets[idx]:offsets[idx + 1]])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Function to unmap the file, which fails while memoryviews of its lines are still referenced
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.fid.close()
+
+    def line(self, lineId):
+        """ Function to return the line numbered lineId, counting from 1
+        """
+        return self.lines(lineId, lineId + 1)[0]
+
+    def lines(self, start, stop):
+        """ Function to return the lines numbered from start up to, but not including, stop
+        """
+        numbers = self.lineNumbers(start, stop)
+        view = memoryview(self.data)
+        return [bytes(_strip(view[begin:end])).decode(self.encoding)
+                for begin, end in zip(self.offsets[numbers].tolist(), self.offsets[numbers + 1].tolist())]
+
+    def raw(self, start, stop):
+        """ Function to return the bytes of the lines numbered from start up to, but not including, stop, including
+            their newlines and any lines without a LineId between them, as a memoryview of the memory map
+        """
+        numbers = self.lineNumbers(start, stop)
+        if not len(numbers):
+            return memoryview(self.data)[0:0]
+        return memoryview(self.data)[self.offsets[numbers[0]]:self.offsets[numbers[-1] + 1]]
+
+    def lineNumbers(self, start, stop):
+        """ Function to return the indexes in the line index of the lines numbered from start up to, but not
+            including, stop
+        """
+        if start < 1 or stop < start or stop > len(self) + 1:
+            raise IndexError('Lines {0} to {1} are out of range for {2} lines'.format(start, stop, len(self)))
+        if self.lineIds is None:
+            return np.arange(start - 1, stop - 1, dtype=np.int64)
+        return self.lineIds[start - 1:stop - 1]
+
+    def buildIndex(self):
+        """ Function to build the line index by scanning the memory map for line endings, one block at a time
+        """
+        size = len(self.data)
+        buffer = np.frombuffer(self.data, dtype=np.uint8) if size else np.empty(0, dtype=np.uint8)
+        offsets = [np.zeros(1, dtype=np.int64)]
+        for blockStart in range(0, size, INDEX_BLOCK_SIZE):
+            block = buffer[blockStart:blockStart + INDEX_BLOCK_SIZE]
+            following = buffer[blockStart + 1:blockStart + INDEX_BLOCK_SIZE + 1]
+            # A carriage return ends a line unless a newline follows it
+            lineEnds = block == ord('\r')
+            lineEnds[:len(following)] &= following != ord('\n')
+            lineEnds |= block == ord('\n')
+            offsets.append(np.flatnonzero(lineEnds).astype(np.int64) + (blockStart + 1))
+            del block, following
+        # Release the buffer, which would otherwise keep the memory map from being closed
+        del buffer
+        offsets = np.concatenate(offsets)
+        if offsets[-1] != size:
+            # Last line without a trailing newline
+            offsets = np.append(offsets, np.int64(size))
+        return offsets
+
+    def loadIndex(self):
+        """ Function to load the saved line index, or return None if there is none or the log file changed after it
+            was saved
+        """
+        if not self.index_file or not os.path.isfile(self.index_file):
+            return None
+        if os.path.getmtime(self.index_file) < os.path.getmtime(self.log_file):
+            return None
+        try:
+            offsets = np.load(self.index_file)
+        except (OSError, ValueError):
+            return None
+        if offsets.dtype != np.int64 or offsets.ndim != 1 or not len(offsets) or offsets[-1] != len(self.data):
+            return None
+        return offsets
+
+    def saveIndex(self):
+        """ Function to save the line index beside the log file, skipped if the directory is not writable
+        """
+        if not self.index_file:
+            return
+        try:
+            with open(self.index_file, 'wb') as fout:
+                np.save(fout, self.offsets)
+        except OSError:
+            pass
+
+    def buildLineIds(self, log_format, non_ascii=None):
+        """ Function to build the LineId index by matching every line against the log format, as
+            logloader.match_lines does
+        """
+        _, regex = logloader.generate_logformat_regex(log_format)
+        view = memoryview(self.data)
+        offsets = self.offsets.tolist()
+        numbers = []
+        for idx in range(len(offsets) - 1):
+            line = bytes(view[offsets[idx]:offsets[idx + 1]]).decode(self.encoding, errors='replace')
+            if non_ascii is not None:
+                line = logloader.NON_ASCII.sub(non_ascii, line)
+            if regex.search(line.strip()) is not None:
+                numbers.append(idx)
+        del view
+        numbers.append(len(offsets) - 1)
+        return np.array(numbers, dtype=np.int64)
+
+    def loadLineIds(self):
+        """ Function to load the saved LineId index, or return None if there is none or the log file changed after
+            it was saved
+        """
+        if not self.lineId_file or not os.path.isfile(self.lineId_file):
+            return None
+        if os.path.getmtime(self.lineId_file) < os.path.getmtime(self.log_file):
+            return None
+        try:
+            lineIds = np.load(self.lineId_file)
+        except (OSError, ValueError):
+            return None
+        if lineIds.dtype != np.int64 or lineIds.ndim != 1 or not len(lineIds) or lineIds[-1] != len(self.offsets) - 1:
+            return None
+        return lineIds
+
+    def saveLineIds(self):
+        """ Function to save the LineId index beside the log file, skipped if the directory is not writable
+        """
+        if not self.lineId_file:
+            return
+        try:
+            with open(self.lineId_file, 'wb') as fout:
+                np.save(fout, self.lineIds)
+        except OSError:
+            pass
+
+
+def _strip(line):
+    """ Function to leave the line ending out of a line
+    """
+    end = len(line)
+    if end and line[end - 1] == ord('\n'):
+        end -= 1
+    if end and line[end - 1] == ord('\r'):
+        end -= 1
+    return line[:end]
@@ -0,0 +1,115 @@
+""" This file implements a compiled pipeline of the preprocessing regular expressions applied to log messages
+"""
+
+import warnings
+import regex as re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# Characters a class may list for a match to require one of them to be present, beyond which checking them costs
+# about as much as running the expression
+MAX_CLASS_LITERALS = 8
+
+
+class Preprocessor(object):
+    """ Replaces the matches of a list of regular expressions in a log message with a placeholder, one expression
+        after another, exactly like calling re.sub for each expression in turn
+
+        Each expression is compiled once. Expressions are also analysed for substrings that any of their matches
+        must contain, either in the match itself or in a lookaround, and are skipped for messages that contain
+        none of them. Skipping an expression that cannot match does not change the result, while most of the
+        cost of re.sub goes into scanning messages for matches that are not there.
+    """
+    def __init__(self, rex, placeholder='<*>'):
+        self.placeholder = placeholder
+        self.steps = []
+        for currentRex in rex:
+            if hasattr(currentRex, 'sub'):
+                pattern, literals = currentRex, required_literals(currentRex.pattern, currentRex.flags)
+            else:
+                pattern, literals = re.compile(currentRex), required_literals(currentRex)
+            self.steps.append((pattern, literals))
+
+    def __call__(self, line):
+        for pattern, literals in self.steps:
+            if literals is None or any(literal in line for literal in literals):
+                line = pattern.sub(self.placeholder, line)
+        return line
+
+
+def required_literals(pattern, flags=0):
+    """ Function to find substrings of which every match of a regular expression contains at least one,
+        returning them as a tuple, or None if there are no such substrings or the expression cannot be analysed
+    """
+    if not isinstance(pattern, str) or flags & re.IGNORECASE:
+        return None
+    try:
+        with warnings.catch_warnings():
+            # Warnings flag syntax such as nested sets that the regex module reads differently from re
+            warnings.simplefilter('error')
+            parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+    if parsed.state.flags & sre_parse.SRE_FLAG_IGNORECASE:
+        return None
+
+    literals = _required(parsed)
+    # re reads fuzzy matching constraints such as {e<=1} as literal text
+    if literals is None or any('{' in literal for literal in literals):
+        return None
+    return tuple(sorted(literals))
+
+
+def _required(subpattern):
+    """ Function to find the best set of required substrings for a sequence of parsed items, preferring longer
+        substrings and then fewer of them
+    """
+    candidates = []
+    run = ''
+    for op, av in subpattern:
+        if op is sre_parse.LITERAL:
+            run += chr(av)
+            continue
+        if run:
+            candidates.append({run})
+            run = ''
+        literals = _required_item(op, av)
+        if literals is not None:
+            candidates.append(literals)
+    if run:
+        candidates.append({run})
+
+    if not candidates:
+        return None
+    return max(candidates, key=lambda literals: (min(len(literal) for literal in literals), -len(literals)))
+
+
+def _required_item(op, av):
+    if op is sre_parse.IN:
+        if len(av) > MAX_CLASS_LITERALS or any(itemOp is not sre_parse.LITERAL for itemOp, _ in av):
+            return None
+        return {chr(itemAv) for _, itemAv in av}
+    if op is sre_parse.SUBPATTERN:
+        _, addFlags, _, subpattern = av
+        if addFlags & sre_parse.SRE_FLAG_IGNORECASE:
+            return None
+        return _required(subpattern)
+    if op is sre_parse.BRANCH:
+        literals = set()
+        for branch in av[1]:
+            branchLiterals = _required(branch)
+            if branchLiterals is None:
+                return None
+            literals |= branchLiterals
+        return literals
+    if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+        low, _, subpattern = av
+        return _required(subpattern) if low >= 1 else None
+    if op is sre_parse.ASSERT:
+        return _required(av[1])
+    if op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+        return _required(av)
+    return None
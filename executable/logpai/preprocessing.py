@@ -0,0 +1,25 @@
+"""
+Preprocessing shared by the SLOGERT scenario scripts and the Drain service
+"""
+
+# Regular expression list for optional preprocessing (default: [])
+regex      = [
+    r'<?([a-zA-Z0-9.!#$%&\'*+\/?^_`{|}~-]+@[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(?:\.[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)*)>?' , # email
+    r'(https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b[-a-zA-Z0-9()@:%_\+.~#?&\/\/=]*)', # http/s
+    r'(/|)([0-9]+\.){3}[0-9]+(:[0-9]+|)(:|)', # IP
+    r'(?<=()[\/:|=\<])([A-Za-z0-9._\/-]+(?=\>))', # \w+[/:|=]\w+
+    r'(?<=()[\/:|=\(])([A-Za-z0-9._\/-]+(?=\)))', # \w+[/:|=]\w+
+    r'(?<=\[)\w+?(?=\])', # inside of a square bracket (e.g., username)
+    r'(?<=\<)\w+?(?=\>)', # inside of a square bracket (e.g., username)
+    r'(?<=\()\w+?(?=\))', # inside of a square bracket (e.g., username)
+    r'(?<=()[\/:|=])([A-Za-z0-9._\/-]+)', # \w+[/:|=]\w+
+    r'(?<=()for user )([A-Za-z0-9._\/-]+)', # username specific for auth
+    r'(?<=()login for )([A-Za-z0-9._\/-]+)', # username on login
+    r'(?<=()LOGIN for )([A-Za-z0-9._\/-]+)', # username on login
+    r'(?<=()sent to )([A-Za-z0-9._\/-]+)', # username on messages
+    r'(?<=()from )([A-Za-z0-9._\/-]+)', # username / ip
+    r'(?<=()pid )([0-9]+)', # pid
+    r'(?<=()pid=)([0-9]+)', # pid
+    r'blk_(|-)[0-9]+' , # block id
+    r'(?<=[^A-Za-z0-9])(\-?\+?\d+)(?=[^A-Za-z0-9])|[0-9]+$', # Numbers
+]
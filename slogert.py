@@ -22,6 +22,10 @@ def main():
     gen_kg_parser.add_argument("--all", "-a", help="run SLOGERT on all config files", action="store_true")
     gen_kg_parser.add_argument("--files", "-f", nargs="+", help="names of config files to run SLOGERT on")
     gen_kg_parser.add_argument("--outfile", "-o", help="path to output the .ttl file")
+    gen_kg_parser.add_argument("--incremental", "-i", help="only rerun SLOGERT on config files whose config, input logs, or SLOGERT version changed since the last incremental run, and keep the output/ directory for the next run", action="store_true")
+    gen_kg_parser.add_argument("--dry-run", "-n", help="list the config files SLOGERT would be called on and their input logs without running it", action="store_true")
+    gen_kg_parser.add_argument("--jobs", "-j", type=int, default=1, help="number of SLOGERT processes to run in parallel (default: 1); SLOGERT must have been rebuilt with --update since its sources last changed")
+    gen_kg_parser.add_argument("--partial", help="combine the KGs of the config files SLOGERT succeeded on even if it failed on others (gen-kg still exits with an error)", action="store_true")
     gen_kg_parser.set_defaults(func=gen_kg.gen_kg)
 
     # Arguments for generating IDs
@@ -30,15 +34,25 @@ def main():
     # gen_ids_parser = subparsers.add_parser("gen-ids", help="convert entities and relations from a generated knowledge graph (.ttl file) to IDs and reconstruct the knowldge graph using those IDs")
     post_process_parser.add_argument("--labels", "-l", help="indicates that the .ttl file contains a label after each triple", action="store_true")
     post_process_parser.add_argument("--gen-ids", "-g", help="convert entities and relations from a generated knowledge graph (.ttl file) to IDs and reconstruct the knowldge graph using those IDs", action="store_true")
+    post_process_parser.add_argument("--stream", help="with --gen-ids, assign IDs while writing the triples in a single pass over the .ttl file, keeping only the ID mappings in memory", action="store_true")
+    post_process_parser.add_argument("--format", choices=["text", "npy"], default="text", help="with --gen-ids, save the ID triples as tab-separated text (default) or as an int32 NumPy array that can be memory-mapped")
+    post_process_parser.add_argument("--workers", "-w", type=int, default=1, help="with --gen-ids, number of processes reading .ttl files in parallel when generating IDs (default: 1)")
     post_process_parser.add_argument("--infile", "-i", required=True, help="path to the .ttl file to process")
     post_process_parser.set_defaults(func=post_process.post_process)
 
     args = parser.parse_args()
+    if getattr(args, "jobs", 1) < 1:
+        parser.error("--jobs must be at least 1")
+    if getattr(args, "workers", 1) < 1:
+        parser.error("--workers must be at least 1")
+    if getattr(args, "format", "text") == "npy" and not args.gen_ids:
+        parser.error("--format npy requires --gen-ids")
 
     # If updating SLOGERT, only update, then return
     # Rebuild with Maven, and skip tests, used mainly for capturing changes to config files
     # If the target/ directory (which contains the SLOGERT executable) does not exist, also build with Maven but do not return
-    if args.update or not os.path.exists("target/"):
+    # A dry run does not need SLOGERT, so it does not build it
+    if args.update or (not os.path.exists("target/") and not getattr(args, "dry_run", False)):
         os.system("mvn install -DskipTests")
         if args.update:
             return
@@ -18,13 +18,15 @@ import java.nio.file.StandardOpenOption;
 import java.util.ArrayList;
 import java.util.Arrays;
 import java.util.List;
+import java.util.regex.Matcher;
 import java.util.stream.Collectors;
 import java.util.stream.Stream;
 
 public class LogInitializer {
 
     private static final Logger log = LoggerFactory.getLogger(LogInitializer.class);
-    private static final String PYTHON_SCRIPT = "executable/logpai/scenario.py";
+    // one script per log source, so that several SLOGERT processes can run logpai concurrently
+    private static final String PYTHON_SCRIPT = "executable/logpai/scenario-%s.py";
     private static final String PYTHON_BASE_SCRIPT = "executable/logpai/scenario-base.py";
 
     public static void initialize(ExtractionConfig config) throws IOException {
@@ -55,7 +57,7 @@ public class LogInitializer {
         log.info("LogPai process started for file: '" + inputFile + "' started");
 
         Path path_base = Paths.get(PYTHON_BASE_SCRIPT);
-        Path path = Paths.get(PYTHON_SCRIPT);
+        Path path = Paths.get(String.format(PYTHON_SCRIPT, config.source));
         Charset charset = StandardCharsets.UTF_8;
         String content = new String(Files.readAllBytes(path_base), charset);
 
@@ -63,17 +65,24 @@ public class LogInitializer {
         content = content.replaceAll("\\$output_dir\\$", config.preprocessedFolder);
         content = content.replaceAll("\\$log_file\\$", inputFile);
         content = content.replaceAll("\\$log_format\\$", config.format);
+        // without a state file, each chunk is parsed from scratch, so leftover output never changes the result
+        content = content.replaceAll("\\$state_file\\$",
+                config.logpaiStateFile == null ? "" : Matcher.quoteReplacement(config.logpaiStateFile));
 
         Files.write(path, content.getBytes(charset));
 
-        ProcessBuilder pb = new ProcessBuilder("./" + PYTHON_SCRIPT);
-        pb.redirectError(ProcessBuilder.Redirect.to(outputError));
+        path.toFile().setExecutable(true);
+
+        ProcessBuilder pb = new ProcessBuilder("./" + path);
+        pb.redirectError(ProcessBuilder.Redirect.appendTo(outputError));
         Process p = pb.start();
 
         try {
             p.waitFor();
         } catch (InterruptedException e) {
             e.printStackTrace();
+        } finally {
+            Files.deleteIfExists(path);
         }
     }
 
@@ -18,6 +18,7 @@ public class ExtractionConfig {
 
     public String sourceLogpai;
     public String sourceLogpaiTemplate;
+    public String logpaiStateFile;
 
     public String logFormat;
     public String logSourceType;
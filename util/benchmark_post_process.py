@@ -0,0 +1,77 @@
+"""
+Benchmarks for the post-processing steps on a generated knowledge graph
+Run with `python -m util.benchmark_post_process`, optionally giving the number of subjects to generate with --subjects
+"""
+
+import argparse
+import os
+import random
+import shlex
+import tempfile
+import time
+
+import util.post_process as post_process
+
+
+"""
+Writes a synthetic knowledge graph in the layout expected by post_process to a .ttl file
+Each subject has a type, a quoted log message with spaces and punctuation, and a list of comma-separated parameters
+path: location to write the file to
+subjects: number of subjects to generate
+"""
+def generate_kg(path, subjects):
+    random.seed(0)
+    users = ["root", "daemon", "www-data", "mail", "phopkins"]
+    messages = ["pam_unix(cron:session): session opened for user {0} by (uid=0)",
+                "Accepted publickey for {0} from 10.0.0.{1} port {2} ssh2",
+                "Connection closed by 192.168.10.{1} port {2} [preauth]",
+                "Failed password for invalid user {0} from 172.17.0.{1} port {2}"]
+
+    with open(path, "w") as file:
+        file.write("@prefix log: <http://w3id.org/sepses/vocab/log/core#> .\n")
+        file.write("@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .\n\n")
+        for i in range(subjects):
+            user = random.choice(users)
+            message = random.choice(messages).format(user, random.randint(1, 254), random.randint(1024, 65535))
+            file.write("<http://w3id.org/sepses/id/event/auth-log/{0}>\n".format(i))
+            file.write("        rdf:type log:Event ;\n")
+            file.write("        log:hasMessage \"{0}\" ;\n".format(message))
+            file.write("        log:hasParameter \"{0}\" , \"{1}\" .\n\n".format(user, random.randint(1, 65535)))
+
+
+"""
+Times a function, returning its result and the time taken in seconds
+"""
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+"""
+Compares loading a .ttl file with the regex tokenizer against the original shlex tokenizer
+path: path to the .ttl file
+"""
+def benchmark_tokenizer(path):
+    size = os.path.getsize(path) / 1e6
+    expected, shlex_time = timed(post_process.load_content, path, shlex.split)
+    lines, split_time = timed(post_process.load_content, path)
+    assert lines == expected, "tokenizer output differs from shlex"
+
+    print("*** Tokenized {0} lines ({1:.1f} MB)".format(len(lines), size))
+    print("shlex:     {0:.2f}s ({1:.1f} MB/s)".format(shlex_time, size / shlex_time))
+    print("tokenizer: {0:.2f}s ({1:.1f} MB/s), {2:.1f}x faster".format(split_time, size / split_time, shlex_time / split_time))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subjects", "-n", type=int, default=100000, help="number of subjects in the generated KG")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "benchmark.ttl")
+        generate_kg(path, args.subjects)
+        benchmark_tokenizer(path)
+
+if __name__ == "__main__":
+    main()
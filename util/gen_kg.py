@@ -2,12 +2,35 @@
 Contains functions for calling and working with SLOGERT to generate knowledge graphs and combine them
 """
 
+import hashlib
+import json
 import os
+import queue
 import shutil
+import subprocess
+import sys
+import threading
 import time
 import yaml
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+# A config file SLOGERT will be called on, with its path, loaded contents, and the input logs matching its source
+PlanEntry = namedtuple("PlanEntry", ["config_file", "path", "config", "input_files"])
+
+# Outcome of a single SLOGERT run on one config file
+SlogertJob = namedtuple("SlogertJob", ["config_file", "returncode", "stdout", "stderr", "elapsed"])
+
+# Size of the blocks used to copy the bodies of .ttl files when combining them (16 MiB)
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+# Number of blocks each reader thread may hold in memory ahead of the writer when combining in parallel
+READ_AHEAD_BLOCKS = 4
+
+# Records the content hash of each config file's inputs from the last successful SLOGERT run, used by --incremental
+MANIFEST_PATH = Path("output/manifest.json")
+
 """
 The main function for generating knowledge graphs that calls SLOGERT on the specified files
 args: command line arguments defined in slogert.py
@@ -25,21 +48,72 @@ def gen_kg(args):
     # The directory path is the outpath until the last '/'
     out_path = Path(args.outfile[:args.outfile.rfind('/')]) if args.outfile else '.'
 
+    slogert_version = get_slogert_version()
+
+    plan = get_plan(in_path, config_path, args)
+    files = list(plan)
+
+    if args.incremental:
+        # Only call SLOGERT on config files whose config, input logs, or SLOGERT version changed since the last run
+        # The .ttl files of the other config files are reused from the output/ directory
+        hashes = {f: hash_sources(plan[f], slogert_version) for f in files}
+        manifest = load_manifest()
+        changed = [f for f in files if manifest.get(f) != hashes[f] or not has_output(plan[f].config)]
+    else:
+        changed = files
+
+    if args.dry_run:
+        print_plan(plan, changed)
+        return
+
+    if slogert_version is None:
+        sys.exit("*** No SLOGERT .jar file in target/, build SLOGERT with `python slogert.py --update` first")
+    # A .jar built before each source got its own logpai script would have parallel jobs overwrite each other's script
+    if is_outdated(slogert_version):
+        sys.exit("*** SLOGERT .jar file in target/ is older than src/main/, rebuild SLOGERT with `python slogert.py --update` first")
+
     # Create output directory if it does not exist
     if not os.path.exists(out_path):
         os.makedirs(out_path)
 
-    slogert_version = get_slogert_version()
+    for f in changed:
+        # Remove the output of earlier runs, e.g., .ttl files if the log now fits in fewer chunks than before, or a
+        # Drain parse tree saved by logpai, which the new run would otherwise start from (e.g., after a run with -s)
+        shutil.rmtree(Path(plan[f].config["targetOttrTurtle"]), ignore_errors=True)
+        shutil.rmtree(Path(plan[f].config["preprocessedFolder"]), ignore_errors=True)
 
-    files = get_files(in_path, config_path, args)
+    if args.incremental:
+        print("*** Reusing previous output of {0} unchanged config file(s)".format(len(files) - len(changed)))
+    else:
+        # A full run may leave output/ in a state the manifest does not describe
+        if os.path.exists(MANIFEST_PATH):
+            os.remove(MANIFEST_PATH)
 
     # Call SLOGERT on all config files that have associated input logs
-    for f in files:
-        os.system("java -jar target/{0} -c src/test/resources/{1}".format(slogert_version, f))
+    results = run_slogert_jobs(slogert_version, changed, args.jobs)
 
-    combine_KGs(out_path, ttl_name)
+    if args.incremental:
+        # Failed runs are left out of the manifest so that they are retried next time
+        for job in results:
+            if job.returncode == 0:
+                manifest[job.config_file] = hashes[job.config_file]
+            else:
+                manifest.pop(job.config_file, None)
+        save_manifest(manifest)
 
-    if not args.save_temps:
+    # A KG missing the sources of failed runs is only combined when asked for, and is still reported as a failure
+    failed = [job.config_file for job in results if job.returncode != 0]
+    if failed and not args.partial:
+        sys.exit("*** Not combining KGs, as SLOGERT failed on {0} (use --partial to combine the others anyway)".format(", ".join(failed)))
+
+    if args.incremental:
+        # Only combine the output of the selected config files, not everything left over in output/
+        combine_KGs(out_path, ttl_name, args.jobs, [Path(plan[f].config["targetOttrTurtle"]) for f in files])
+    else:
+        combine_KGs(out_path, ttl_name, args.jobs)
+
+    # Incremental runs need the output/ directory to be kept for the next run
+    if not args.save_temps and not args.incremental:
         shutil.rmtree(Path("output/"))
 
     # Move output file to output directory
@@ -50,79 +124,344 @@ def gen_kg(args):
     end = time.time()
     print("*** KG generated in {:.2f}s".format(end - start))
 
+    if failed:
+        sys.exit("*** KG is missing the output of {0}, on which SLOGERT failed".format(", ".join(failed)))
+
 
 """
-Returns the SLOGERT .jar file with dependencies to be used when SLOGERT is called
+Returns the SLOGERT .jar file with dependencies to be used when SLOGERT is called, or None if SLOGERT has not been built
 """
 def get_slogert_version():
+    if not os.path.isdir("target/"):
+        return None
     version = [f for f in os.listdir("target/") if f.endswith("with-dependencies.jar")]
-    return version[0]
+    return version[0] if version else None
+
+
+"""
+Determines if the SLOGERT .jar file was built before the last change to the sources in src/main/
+slogert_version: the SLOGERT .jar file returned by get_slogert_version
+"""
+def is_outdated(slogert_version):
+    built = os.path.getmtime(os.path.join("target", slogert_version))
+    return any(f.stat().st_mtime > built for f in Path("src/main/").glob("**/*") if f.is_file())
 
 
 """
-Determines if there is a log file in the input folder that matches the source type of the given config file
-config_file: SLOGERT config file corresponding to a log type
-input_files: the files located in the in_path, where log files to be processed are located
+Runs SLOGERT on a single config file, capturing its output instead of printing it
+Returns a SlogertJob with the return code, stdout, stderr, and wall time of the run
+slogert_version: the SLOGERT .jar file returned by get_slogert_version
+config_file: name of the config file in src/test/resources/
+"""
+def run_slogert(slogert_version, config_file):
+    start = time.time()
+    command = ["java", "-jar", "target/{0}".format(slogert_version), "-c", "src/test/resources/{0}".format(config_file)]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        returncode, stdout, stderr = result.returncode, result.stdout, result.stderr
+    except OSError as e:
+        # e.g., java is not installed or not on the PATH
+        returncode, stdout, stderr = -1, "", str(e)
+
+    return SlogertJob(config_file, returncode, stdout, stderr, time.time() - start)
+
+
 """
-def source_match(config_file, input_files):
-    # Keep only the config files that have relevant input log files
-    # e.g., if there is no auth.log, SLOGERT will not be called with auth-config.yaml
+Runs SLOGERT on each config file, with at most jobs processes running at once
+Reports the wall time of each run as it finishes and a summary of any failed runs at the end
+Returns the list of SlogertJobs in the order the runs finished
+slogert_version: the SLOGERT .jar file returned by get_slogert_version
+files: names of the config files to run SLOGERT on
+jobs: maximum number of SLOGERT processes to run in parallel
+"""
+def run_slogert_jobs(slogert_version, files, jobs=1):
+    results = []
+    if not files:
+        return results
+
+    print("*** Running SLOGERT on {0} config file(s) with {1} job(s)...".format(len(files), jobs))
+    # Each job spends its time waiting on a separate JVM, so threads are enough to run them in parallel
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_slogert, slogert_version, f) for f in files]
+        for future in as_completed(futures):
+            job = future.result()
+            status = "done" if job.returncode == 0 else "FAILED with exit code {0}".format(job.returncode)
+            print("*** SLOGERT {0} on {1} in {2:.2f}s".format(status, job.config_file, job.elapsed))
+            results.append(job)
+
+    failed = [job for job in results if job.returncode != 0]
+    if failed:
+        print("*** {0} of {1} SLOGERT run(s) failed:".format(len(failed), len(results)))
+        for job in failed:
+            print("****** {0} (exit code {1})".format(job.config_file, job.returncode))
+            # The end of stderr is usually enough to tell why the run failed
+            print("\n".join(job.stderr.strip().splitlines()[-20:]))
+
+    return results
+
+
+"""
+Indexes the files in the in_path by name, so that the input logs of each config file can be looked up directly
+Returns a dictionary mapping file names to the sorted list of paths with that name (e.g., auth.log in each device folder)
+in_path: path to log files to be processed
+"""
+def index_inputs(in_path):
+    index = {}
+    for f in sorted(in_path.glob("**/*")):
+        if f.is_file():
+            index.setdefault(f.name, []).append(f)
+
+    return index
+
+
+"""
+Loads a SLOGERT config file
+config_file: path to the config file
+"""
+def load_config(config_file):
     with open(config_file, "r") as file:
-        config_data = yaml.safe_load(file)
-        
-        for input_file in input_files:
-            if input_file.name == config_data["source"]:
-                return True
-        
-        return False
+        return yaml.safe_load(file)
 
 
 """
-Gets all files that SLOGERT will be called on
-Returns all relevant config files if --all flag is set, otherwise returns files specified with --files argument
+Resolves which config files SLOGERT will be called on, loading each config file and indexing the input files only once
+Uses all config files if --all flag is set, otherwise the files specified with --files argument
+Config files without matching input logs are left out
+e.g., if there is no auth.log, SLOGERT will not be called with auth-config.yaml
+Returns a dictionary mapping config file names to PlanEntrys, in the order SLOGERT will be called on them
 in_path: path to log files to be processed
 config_path: path to SLOGERT config files corresponding to log types
 args: command line arguments defined in the main function
 """
-def get_files(in_path, config_path, args):
-    # Get all config and input files
-    config_files = [f for f in config_path.glob("**/*") if f.is_file() and f.name.endswith(".yaml")]
-    input_files = [f for f in in_path.glob("**/*") if f.is_file()]
-
-    sources = []
+def get_plan(in_path, config_path, args):
     if args.all:
-        for f in config_files:
-            if source_match(f, input_files):
-                sources.append(f.name)
+        config_files = [(f.name, f) for f in config_path.glob("**/*") if f.is_file() and f.name.endswith(".yaml")]
     elif args.files is not None:
-        for f in args.files:
-            file = Path(config_path / f)
-            if source_match(file, input_files):
-                sources.append(f)
+        config_files = [(f, config_path / f) for f in args.files]
+    else:
+        config_files = []
+
+    index = index_inputs(in_path)
+    plan = {}
+    for name, path in config_files:
+        config = load_config(path)
+        input_files = index.get(config["source"], [])
+        if input_files:
+            plan[name] = PlanEntry(name, path, config, input_files)
 
-    return sources
+    return plan
+
+
+"""
+Prints the config files SLOGERT would be called on and the input logs each of them would process, e.g., for --dry-run
+plan: the plan returned by get_plan
+changed: names of the config files SLOGERT would actually be rerun on, if different from the whole plan
+"""
+def print_plan(plan, changed=None):
+    changed = set(plan if changed is None else changed)
+    print("*** SLOGERT would be called on {0} of {1} config file(s):".format(len(changed), len(plan)))
+    for entry in plan.values():
+        status = "" if entry.config_file in changed else " (unchanged, previous output reused)"
+        print("{0} -> {1}{2}".format(entry.config_file, entry.config["source"], status))
+        for input_file in entry.input_files:
+            print("    {0}".format(input_file))
+
+
+"""
+Computes a content hash of everything that determines the output of SLOGERT for a config file:
+the SLOGERT version, the config file itself, and the paths and contents of the input logs it processes
+entry: the PlanEntry of the config file, as returned by get_plan
+slogert_version: the SLOGERT .jar file returned by get_slogert_version
+"""
+def hash_sources(entry, slogert_version):
+    digest = hashlib.sha256()
+    # Without a built SLOGERT (e.g., for --dry-run), the hash never matches and every config file counts as changed
+    digest.update((slogert_version or "").encode("utf-8") + b"\0")
+    with open(entry.path, "rb") as file:
+        digest.update(file.read())
+
+    for input_file in entry.input_files:
+        # Include the path and size so that moving or splitting logs between devices also counts as a change
+        digest.update("\0{0}\0{1}\0".format(input_file.as_posix(), input_file.stat().st_size).encode("utf-8"))
+        with open(input_file, "rb") as file:
+            for block in iter(lambda: file.read(COPY_BUFFER_SIZE), b""):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+"""
+Determines if SLOGERT has already produced .ttl files for a config file
+config_data: the loaded config file
+"""
+def has_output(config_data):
+    return any(Path(config_data["targetOttrTurtle"]).glob("**/*.ttl"))
+
+
+"""
+Loads the manifest of config file hashes written by the last incremental run
+Returns an empty manifest if there is none
+"""
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+
+    with open(MANIFEST_PATH, "r") as file:
+        return json.load(file)
+
+
+"""
+Saves the manifest of config file hashes for the next incremental run
+manifest: dictionary mapping config file names to the hash of their sources
+"""
+def save_manifest(manifest):
+    os.makedirs(MANIFEST_PATH.parent, exist_ok=True)
+    with open(MANIFEST_PATH, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+
+"""
+Reads the block of prefix declarations at the start of a .ttl file
+Returns a list of (prefix name, IRI, declaration line) tuples and the byte offset where the body of the file begins
+path: path to the .ttl file
+"""
+def read_prefixes(path):
+    prefixes = []
+    with open(path, "rb") as file:
+        offset = 0
+        for line in iter(file.readline, b""):
+            stripped = line.strip()
+            if stripped.startswith(b"@prefix"):
+                # e.g., @prefix log: <http://w3id.org/sepses/vocab/log/core#> .
+                name, iri = stripped.split(None, 3)[1:3]
+                prefixes.append((name, iri, stripped + b"\n"))
+            elif stripped:
+                break
+            offset += len(line)
+
+    return prefixes, offset
+
+
+"""
+Yields the body of a .ttl file as raw blocks of bytes
+path: path to the .ttl file
+offset: byte offset where the body of the file begins, as returned by read_prefixes
+"""
+def read_blocks(path, offset):
+    with open(path, "rb") as infile:
+        infile.seek(offset)
+        for block in iter(lambda: infile.read(COPY_BUFFER_SIZE), b""):
+            yield block
+
+
+"""
+Reads the body of a .ttl file into a bounded queue so that it can be written out by another thread
+The queue ends with None once the file is read, or with the exception raised while reading it
+path: path to the .ttl file
+offset: byte offset where the body of the file begins
+blocks: queue to put the blocks into
+stop: event set by the writer to tell readers to give up, e.g., if writing fails
+"""
+def read_ahead(path, offset, blocks, stop):
+    def put(item):
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for block in read_blocks(path, offset):
+            if not put(block):
+                return
+    except Exception as e:
+        put(e)
+        return
+    put(None)
+
+
+"""
+Yields the blocks put into a queue by read_ahead, re-raising any error the reader ran into
+blocks: queue filled by read_ahead
+"""
+def drain_blocks(blocks):
+    while True:
+        block = blocks.get()
+        if block is None:
+            return
+        if isinstance(block, Exception):
+            raise block
+        yield block
 
 
 """
 Get output files after SLOGERT has run, and combine all separate KGs into one
+Files are combined in sorted path order, so combining the same output twice produces byte-identical KGs
+Only the leading prefix block of each file is read line by line; the rest of the file is copied as raw bytes in large blocks
+Prefixes are merged across files, with each distinct declaration written once at the top of the combined file
+If a file redeclares a prefix with a different IRI, the redeclaration is written just before that file's body
 out_path: path to where the output of this script will be written
 ttl_name: the name of the .ttl knowledge graph file to be created
+jobs: number of threads reading .ttl files at once; the combined file is still written by a single thread, in order
+output_dirs: directories to collect .ttl files from, or None for the whole output directory
 """
-def combine_KGs(out_path, ttl_name):
+def combine_KGs(out_path, ttl_name, jobs=1, output_dirs=None):
     # Note that SLOGERT puts intermediate files in the output directory, not the out_path created in this script
-    output_files = [f for f in Path("output/").glob('**/*') if f.is_file() and f.name.endswith(".ttl") and not f.name.endswith("template.ttl") and not f.name == ttl_name]
-    with open(os.path.join(out_path, ttl_name), "w", encoding="utf-8") as outfile:
+    if output_dirs is None:
+        output_dirs = [Path("output/")]
+    output_files = sorted(f for d in output_dirs for f in d.glob('**/*') if f.is_file() and f.name.endswith(".ttl") and not f.name.endswith("template.ttl") and not f.name == ttl_name)
+    with open(os.path.join(out_path, ttl_name), "wb") as outfile, ThreadPoolExecutor(max_workers=jobs) as executor:
         print("*** Combining .ttl files...")
         start = time.time()
-        
-        # Loop through .ttl files, exlcuding .ttl.log files
-        for count, f in enumerate(output_files):
-            with open(f, "r", encoding="utf-8") as infile:
-                # Loop through each line of the file and copy it to the output file
-                # If the file is not the first encountered, delete the prefixes, as they should be constant between all files
-                for line in infile:
-                    if count == 0 or (count > 0 and not line.startswith("@prefix")):
-                        outfile.write(line)
-        
+
+        headers = list(executor.map(read_prefixes, output_files))
+
+        # The first declaration of each prefix goes into the shared header of the combined file
+        header = {}
+        for prefixes, _ in headers:
+            for name, iri, declaration in prefixes:
+                header.setdefault(name, (iri, declaration))
+
+        for _, declaration in header.values():
+            outfile.write(declaration)
+        outfile.write(b"\n")
+        active = {name: iri for name, (iri, _) in header.items()}
+
+        if jobs > 1:
+            # Files are handed to the pool in the order they are written, so the file being written is always being read
+            # while the following ones are read ahead into their queues
+            stop = threading.Event()
+            queues = [queue.Queue(maxsize=READ_AHEAD_BLOCKS) for _ in output_files]
+            for f, (_, offset), blocks in zip(output_files, headers, queues):
+                executor.submit(read_ahead, f, offset, blocks, stop)
+            bodies = [drain_blocks(blocks) for blocks in queues]
+        else:
+            bodies = [read_blocks(f, offset) for f, (_, offset) in zip(output_files, headers)]
+
+        try:
+            for (prefixes, _), body in zip(headers, bodies):
+                redeclared = False
+                for name, iri, declaration in prefixes:
+                    if active[name] != iri:
+                        outfile.write(declaration)
+                        active[name] = iri
+                        redeclared = True
+                if redeclared:
+                    outfile.write(b"\n")
+
+                block = b""
+                for block in body:
+                    outfile.write(block)
+
+                # Make sure the next file starts on a new line
+                if block and not block.endswith(b"\n"):
+                    outfile.write(b"\n")
+        finally:
+            if jobs > 1:
+                stop.set()
+
+        size = outfile.tell()
         end = time.time()
-        print("*** Combined .ttl files in {:.2f}s".format(end - start))
+        print("*** Combined {} .ttl files in {:.2f}s ({:.1f} MB/s)".format(len(output_files), end - start, size / 1e6 / max(end - start, 1e-9)))
@@ -0,0 +1,141 @@
+"""
+Contains a compact binary format for the entity and relation ID mappings generated by post-processing
+The keys are stored sorted in a single string pool with an array of offsets into it, so a mapping can be memory-mapped
+and searched in place instead of being parsed into a dictionary
+Layout (little-endian):
+    header: magic, number of keys n, size of the string pool in bytes
+    pool: the UTF-8 encoded keys in sorted order, padded to a multiple of 8 bytes
+    offsets: n + 1 uint64, where key i is pool[offsets[i]:offsets[i + 1]]
+    ids: n uint64, where ids[i] is the ID of key i
+    order: n uint64, where order[id] is the index of the key with that ID
+"""
+
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC = b"SLGIDS\x01\x00"
+HEADER = struct.Struct("<8sQQ")
+
+
+"""
+Writes ID mappings to a binary file
+path: location to write the file to
+sorted_items: (key, ID) pairs sorted by key, with keys as UTF-8 encoded bytes
+"""
+def save_ids_binary(path, sorted_items):
+    offsets = array("Q", [0])
+    ids = array("Q")
+
+    # Write to a temporary file first, since the items may be streamed from a mapping of the file being replaced
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, 0, 0))
+        for key, id in sorted_items:
+            file.write(key)
+            offsets.append(offsets[-1] + len(key))
+            ids.append(int(id))
+
+        pool_size = offsets[-1]
+        file.write(b"\0" * (-pool_size % 8))
+
+        order = array("Q", bytes(8 * len(ids)))
+        for index, id in enumerate(ids):
+            order[id] = index
+
+        file.write(offsets.tobytes())
+        file.write(ids.tobytes())
+        file.write(order.tobytes())
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, len(ids), pool_size))
+
+    os.replace(tmp_path, path)
+
+
+"""
+Sorts ID mappings by key, in the order expected by save_ids_binary
+ids: dictionary containing mappings of entities or relations to IDs
+"""
+def sort_ids(ids):
+    return sorted((key.encode("utf-8"), id) for key, id in ids.items())
+
+
+"""
+Read-only ID mappings backed by a memory-mapped binary file written by save_ids_binary
+Keys are looked up by binary search over the sorted string pool, so opening the file costs nothing up front
+and memory use does not grow with the number of keys looked up
+"""
+class MappedIds:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count, pool_size = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError("{0} is not a binary ID file".format(path))
+
+        self.pool_start = HEADER.size
+        arrays_start = self.pool_start + pool_size + (-pool_size % 8)
+        view = memoryview(self.map)
+        self.offsets = view[arrays_start:arrays_start + 8 * (self.count + 1)].cast("Q")
+        ids_start = arrays_start + 8 * (self.count + 1)
+        self.ids = view[ids_start:ids_start + 8 * self.count].cast("Q")
+        order_start = ids_start + 8 * self.count
+        self.order = view[order_start:order_start + 8 * self.count].cast("Q")
+        view.release()
+
+    def key(self, index):
+        return self.map[self.pool_start + self.offsets[index]:self.pool_start + self.offsets[index + 1]]
+
+    def index(self, key):
+        key = key.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count and self.key(low) == key:
+            return low
+        return -1
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.index(key) >= 0
+
+    def __getitem__(self, key):
+        index = self.index(key)
+        if index < 0:
+            raise KeyError(key)
+        return self.ids[index]
+
+    def get(self, key, default=None):
+        index = self.index(key)
+        return self.ids[index] if index >= 0 else default
+
+    # (key, ID) pairs sorted by key, with keys as UTF-8 encoded bytes, as expected by save_ids_binary
+    def items_by_key(self):
+        for index in range(self.count):
+            yield self.key(index), self.ids[index]
+
+    # (key, ID) pairs sorted by ID, as written to the text ID files
+    def items_by_id(self):
+        for id in range(self.count):
+            yield self.key(self.order[id]).decode("utf-8"), id
+
+    def close(self):
+        for view in (self.offsets, self.ids, self.order):
+            view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -10,11 +10,29 @@ Note also that the knowledge graph can also be labeled, as in a testing dataset
 """
 
 import os
+import re
 import shlex
 import string
+import struct
 import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from heapq import merge
+from itertools import chain, repeat
 from pathlib import Path
 
+from util.id_store import MappedIds, save_ids_binary, sort_ids
+
+# A token as shlex.split finds it: unquoted text, "double-quoted" and 'single-quoted' strings, with no whitespace between them
+# A quote that does not start a complete quoted string is matched on its own, so that the line can be handed to shlex
+TOKEN_REGEX = re.compile(r"""(?:[^ \t\r\n"']+|"[^"]*"|'[^']*')+|["']""")
+QUOTED_REGEX = re.compile(r""""([^"]*)"|'([^']*)'""")
+
+# Size reserved for the header of .npy files written with --format npy, which must be a multiple of 64
+NPY_HEADER_SIZE = 128
+
+# Number of IDs buffered in memory before they are written to a .npy file
+NPY_BATCH_SIZE = 3 * 1024 * 1024
 
 """
 Perform post-processing on constructed KG
@@ -28,12 +46,16 @@ def post_process(args):
     in_path = Path(args.infile[:args.infile.rfind('/')]) 
     path = os.path.join(in_path, "{0}.txt".format(ttl_name.split('.')[0]))
 
-    if args.gen_ids:
+    if args.gen_ids and args.stream:
+        gen_ids_streaming(args, in_path, ttl_name, path)
+
+    elif args.gen_ids:
         lines, ent_ids, rel_ids = gen_ids(args, in_path, ttl_name)
         save_data(args, path, lines, ent_ids, rel_ids)
 
     else:
-        lines = load_content(os.path.join(in_path, ttl_name))
+        # Without IDs, each line can be written out as soon as it is read
+        lines = iter_content(os.path.join(in_path, ttl_name))
 
         # If the data is labeled, it must be test data. 
         # Data with no labels must be training data, since it is implicitly labeled as observed
@@ -52,6 +74,92 @@ def is_valid_entity(entity: str):
     return entity not in string.punctuation
 
 
+"""
+Dictionary that assigns the next free ID to any key it is asked for that it does not have yet
+Used to assign IDs while the triples are being written, so that the KG only has to be read once
+Keys with previously generated IDs are looked up in base, and only new keys are stored in the dictionary itself
+"""
+class IdDict(dict):
+    def __init__(self, base=None):
+        super().__init__()
+        self.base = {} if base is None else base
+
+    def __missing__(self, key):
+        id = self.base.get(key)
+        if id is None:
+            id = len(self.base) + len(self)
+            self[key] = id
+        return id
+
+
+"""
+Finds the directory containing previously generated ID mappings under in_path
+Returns None if no IDs have been generated yet
+in_path: path to the directory containing the KG
+"""
+def find_ids(in_path):
+    id_location = None
+    for root, dirs, files in os.walk(str(in_path)):
+        if "entity_ids.txt" in files and "relation_ids.txt" in files:
+            id_location = root
+
+    return id_location
+
+
+"""
+Collects the unique entities and relations of a .ttl file, each in the order they first appear
+Used as the unit of work when IDs are generated for several files in parallel
+Returns a list of entities and a list of relations
+path: path to the .ttl file
+labels: true if the data is labeled, in which case the last item of each line is a label rather than an entity
+"""
+def collect_ids(path, labels):
+    # Dictionaries keep the order keys were first inserted in, so they double as ordered sets
+    entities = {}
+    relations = {}
+
+    # Go through each list (line)
+    # output.ttl expected to look like
+    # subject
+    #   relation    list(object)
+    #   relation    list(object)
+    # ...
+    # If the list has only one thing, it must be the subject entity
+    # If there are two or more things, the first is the relation and the rest are object entities
+    for line in iter_content(path):
+        if len(line) == 1:
+            if is_valid_entity(line[0]):
+                entities[line[0]] = None
+        elif len(line) > 1:
+            relations[line[0]] = None
+
+            # If data is labeled, last item will be label, so discard
+            num_args = len(line) - 1 if labels else len(line)
+            for entity in line[1:num_args]:
+                if is_valid_entity(entity):
+                    entities[entity] = None
+
+    return list(entities), list(relations)
+
+
+"""
+Assigns global IDs to the entities and relations collected from each file by collect_ids
+IDs are assigned in order of first occurrence, going through the files in order,
+which gives the same IDs as reading all of the files one after the other
+shards: (entities, relations) pairs returned by collect_ids, in file order
+"""
+def merge_ids(shards):
+    ent_ids = {}
+    rel_ids = {}
+    for entities, relations in shards:
+        for entity in entities:
+            ent_ids.setdefault(entity, len(ent_ids))
+        for relation in relations:
+            rel_ids.setdefault(relation, len(rel_ids))
+
+    return ent_ids, rel_ids
+
+
 """
 Assign IDs to each entity and relation in the KG.
 Regenerate the triples using the IDs.
@@ -63,71 +171,112 @@ def gen_ids(args, in_path, ttl_name):
     ent_ids = {}
     rel_ids = {}
 
-    ids_exist = False
-    id_location = ""
-
-    for root, dirs, files in os.walk(str(in_path)):
-        if "entity_ids.txt" in files and "relation_ids.txt" in files:
-            ids_exist = True
-            id_location = root
+    id_location = find_ids(in_path)
 
     # If IDs have already been generated for the dataset, load them from files
     # Otherwise, generate the IDs from scratch
-    if ids_exist:
+    if id_location is not None:
         print("IDs already generated")
         # Gather IDs from existing files
-        ent_ids = load_ids(os.path.join(id_location, "entity_ids.txt"), ent_ids)
-        rel_ids = load_ids(os.path.join(id_location, "relation_ids.txt"), rel_ids)
-        lines = load_content(os.path.join(in_path, ttl_name))
+        ent_ids = open_ids(os.path.join(id_location, "entity_ids.txt"))
+        rel_ids = open_ids(os.path.join(id_location, "relation_ids.txt"))
     else:
-        path_list = in_path.glob("**/*.ttl")
-        ent_count = 0
-        rel_count = 0
-        for file in path_list:
-            lines = load_content(file)
-
-            # Go through each list (line)
-            # output.ttl expected to look like
-            # subject
-            #   relation    list(object)
-            #   relation    list(object)
-            # ...
-            # If the list has only one thing, it must be the subject entity
-            # If there are two or more things, the first is the relation and the rest are object entities
-            for i in range(len(lines)):
-                if len(lines[i]) == 1 and lines[i][0] not in ent_ids:
-                    if not is_valid_entity(lines[i][0]):
-                        # lines[i].remove(lines[i][0])
-                        continue
-                    ent_ids[lines[i][0]] = ent_count
-                    ent_count += 1
-                elif len(lines[i]) > 1:
-                    if lines[i][0] not in rel_ids:
-                        rel_ids[lines[i][0]] = rel_count
-                        rel_count += 1
-
-                    # If data is labeled, last item will be label, so discard
-                    num_args = len(lines[i]) - 1 if args.labels else len(lines[i])
-                    for j in range(1, num_args):
-                        if not is_valid_entity(lines[i][j]):
-                            # lines[i].remove(lines[i][j])
-                            continue
-                        if lines[i][j] not in ent_ids:
-                            ent_ids[lines[i][j]] = ent_count
-                            ent_count += 1
+        # Files are processed in sorted order, so the IDs do not depend on the file system or the number of workers
+        path_list = sorted(in_path.glob("**/*.ttl"))
+        if args.workers > 1:
+            print("Collecting entities and relations from {0} files with {1} workers".format(len(path_list), args.workers))
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                shards = executor.map(collect_ids, path_list, repeat(args.labels))
+                ent_ids, rel_ids = merge_ids(shards)
+        else:
+            ent_ids, rel_ids = merge_ids(collect_ids(file, args.labels) for file in path_list)
         
         end = time.time()
         print("*** IDs generated in {:.2f}s".format(end - start))
         save_ids(os.path.join(in_path, "entity_ids.txt"), ent_ids)
         save_ids(os.path.join(in_path, "relation_ids.txt"), rel_ids)
 
+    lines = iter_content(os.path.join(in_path, ttl_name))
     return lines, ent_ids, rel_ids
 
+"""
+Assign IDs to each entity and relation while writing the ID triples, reading the KG only once
+Only the ID mappings are kept in memory, so KGs larger than memory can be processed
+IDs are assigned in the order entities and relations first appear in a triple
+If IDs have already been generated for the dataset, they are loaded and extended with any new entities and relations
+args: command line arguments defined in slogert.py
+in_path: path to the directory containing the KG
+ttl_name: name of the .ttl file to process
+path: path to save dataset to
+"""
+def gen_ids_streaming(args, in_path, ttl_name, path):
+    print("*** Generating IDs while reconstructing KG...")
+    start = time.time()
+    id_location = find_ids(in_path)
+    if id_location is not None:
+        print("Extending previously generated IDs")
+        ent_ids = IdDict(open_ids(os.path.join(id_location, "entity_ids.txt")))
+        rel_ids = IdDict(open_ids(os.path.join(id_location, "relation_ids.txt")))
+    else:
+        id_location = in_path
+        ent_ids = IdDict()
+        rel_ids = IdDict()
+
+    save_data(args, path, iter_content(os.path.join(in_path, ttl_name)), ent_ids, rel_ids)
+    save_ids(os.path.join(id_location, "entity_ids.txt"), ent_ids)
+    save_ids(os.path.join(id_location, "relation_ids.txt"), rel_ids)
+
+    end = time.time()
+    print("*** {0} entity and {1} relation IDs generated in {2:.2f}s".format(len(ent_ids.base) + len(ent_ids), len(rel_ids.base) + len(rel_ids), end - start))
+
+
+"""
+Goes through the lines of a .ttl file, keeping track of the current subject and relation
+For every object entity in a line, yields a new (subject, relation, object, label) triple
+The label is None if the data is not labeled
+args: command line arguments defined in slogert.py
+lines: original lines of dataset with extra whitespace and symbols removed, either as a list or streamed from iter_content
+ent_dict: dictionary containing mappings of entities to IDs
+rel_dict: dictionary containing mapping of relations to IDs
+"""
+def iter_triples(args, lines, ent_dict=None, rel_dict=None):
+    for line in lines:
+        if len(line) == 1 and is_valid_entity(line[0]):
+            current_sub = ent_dict[line[0]] if args.gen_ids else line[0]
+            continue
+
+        # If data is labeled, last item will be the label
+        num_args = len(line) - 1 if args.labels else len(line)
+        label = line[-1] if args.labels else None
+        for j in range(1, num_args):
+            if is_valid_entity(line[j]):
+                current_rel = rel_dict[line[0]] if args.gen_ids else line[0]
+                current_obj = ent_dict[line[j]] if args.gen_ids else line[j]
+                yield current_sub, current_rel, current_obj, label
+
+
+"""
+Builds the header of a .npy file holding a 2D int32 array, as read by numpy.load
+The header is padded to a fixed size, so that it can be written before the number of rows is known and rewritten afterwards
+rows: number of rows in the array
+columns: number of columns in the array
+"""
+def npy_header(rows, columns=1):
+    shape = "({0}, {1})".format(rows, columns) if columns > 1 else "({0},)".format(rows)
+    header = "{{'descr': '<i4', 'fortran_order': False, 'shape': {0}, }}".format(shape)
+    # Magic string, version 1.0, and header length, followed by the header padded with spaces and ended with a newline
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
 """
 Recreate training/testing data using entity and relation IDs
 Output file will be in triple form (e.g., 0 0 1)
+With --format npy, the ID triples are instead saved as an (N, 3) int32 array in a .npy file next to path,
+so that they can be memory-mapped with numpy.load(path, mmap_mode="r") without parsing
+Labels are then saved as a parallel int32 array in a _labels.npy file
 path: path to save dataset to 
-lines: original lines of dataset with extra whitespace and symbols removed
+lines: original lines of dataset with extra whitespace and symbols removed, either as a list or streamed from iter_content
 ent_dict: dictionary containing mappings of entities to IDs
 rel_dict: dictionary containing mapping of relations to IDs
 labels: true if the data is labeled (testing/validation data), false otherwise (training data)
@@ -135,40 +284,61 @@ labels: true if the data is labeled (testing/validation data), false otherwise (
 def save_data(args, path, lines, ent_dict=None, rel_dict=None):
     def save_with_labels():
         label_path = os.path.splitext(path)[0] + "_labels.txt"
-        # Go back through .ttl file, keeping track of the current subject and relation
-        # For every object entity in that line, make a new triple
         with open(path, "w") as data_file, open(label_path, "w") as label_file:
-            for i in range(len(lines)):
-                if len(lines[i]) == 1 and is_valid_entity(lines[i][0]):
-                    current_sub = ent_dict[lines[i][0]] if args.gen_ids else lines[i][0]
-                    continue
-
-                num_args = len(lines[i]) - 1
-                for j in range(1, num_args):
-                    if is_valid_entity(lines[i][j]):
-                        current_rel = rel_dict[lines[i][0]] if args.gen_ids else lines[i][0]
-                        current_obj = ent_dict[lines[i][j]] if args.gen_ids else lines[i][j]
-                        data_file.write(str(current_sub) + "\t" + str(current_rel) + "\t" + str(current_obj) + "\n")
-                        label_file.write(str(lines[i][-1]) + "\n")
+            for current_sub, current_rel, current_obj, label in iter_triples(args, lines, ent_dict, rel_dict):
+                data_file.write(str(current_sub) + "\t" + str(current_rel) + "\t" + str(current_obj) + "\n")
+                label_file.write(str(label) + "\n")
     
     def save_no_labels():
         with open(path, "w") as data_file:
-            for i in range(len(lines)):
-                if len(lines[i]) == 1 and is_valid_entity(lines[i][0]):
-                    current_sub = ent_dict[lines[i][0]] if args.gen_ids else lines[i][0]
-                    continue
-
-                num_args = len(lines[i])
-                for j in range(1, num_args):
-                    if is_valid_entity(lines[i][j]):
-                        current_rel = rel_dict[lines[i][0]] if args.gen_ids else lines[i][0]
-                        current_obj = ent_dict[lines[i][j]] if args.gen_ids else lines[i][j]
-                        data_file.write(str(current_sub) + "\t" + str(current_rel) + "\t" + str(current_obj) + "\n")
+            for current_sub, current_rel, current_obj, _ in iter_triples(args, lines, ent_dict, rel_dict):
+                data_file.write(str(current_sub) + "\t" + str(current_rel) + "\t" + str(current_obj) + "\n")
+
+    def save_npy():
+        data_path = os.path.splitext(path)[0] + ".npy"
+        label_path = os.path.splitext(path)[0] + "_labels.npy"
+        files = [open(data_path, "wb")] + ([open(label_path, "wb")] if args.labels else [])
+        try:
+            for file in files:
+                file.write(npy_header(0))
+
+            triples = array("i")
+            labels = array("i")
+            count = 0
+            for current_sub, current_rel, current_obj, label in iter_triples(args, lines, ent_dict, rel_dict):
+                triples.extend((current_sub, current_rel, current_obj))
+                if args.labels:
+                    try:
+                        labels.append(int(label))
+                    except ValueError:
+                        raise ValueError("Label {0} is not an integer, so the KG cannot be saved with --format npy".format(label))
+                count += 1
+
+                # Write in batches to keep memory use bounded
+                if len(triples) >= NPY_BATCH_SIZE:
+                    files[0].write(triples.tobytes())
+                    del triples[:]
+                    if args.labels:
+                        files[1].write(labels.tobytes())
+                        del labels[:]
+
+            files[0].write(triples.tobytes())
+            files[0].seek(0)
+            files[0].write(npy_header(count, 3))
+            if args.labels:
+                files[1].write(labels.tobytes())
+                files[1].seek(0)
+                files[1].write(npy_header(count))
+        finally:
+            for file in files:
+                file.close()
 
     print("*** Reconstructing KG using IDs...")
     start = time.time()
 
-    if args.labels:
+    if args.format == "npy":
+        save_npy()
+    elif args.labels:
         save_with_labels()
     else:
         save_no_labels()
@@ -178,19 +348,47 @@ def save_data(args, path, lines, ent_dict=None, rel_dict=None):
     print("****** End of KG reconstruction")
 
 
+"""
+Returns the (key, ID) pairs of ID mappings sorted by ID
+ids: dictionary or MappedIds containing mappings of entities or relations to IDs
+"""
+def ids_by_id(ids):
+    if isinstance(ids, MappedIds):
+        return ids.items_by_id()
+    return sorted(ids.items(), key=lambda x : x[1])
+
+
+"""
+Returns the (key, ID) pairs of ID mappings sorted by key, with keys encoded as expected by save_ids_binary
+ids: dictionary or MappedIds containing mappings of entities or relations to IDs
+"""
+def ids_by_key(ids):
+    if isinstance(ids, MappedIds):
+        return ids.items_by_key()
+    return sort_ids(ids)
+
+
 """
 Saves mappings of IDs to strings to a file
+A binary copy of the mappings is saved next to it (e.g., entity_ids.bin next to entity_ids.txt) for fast lookups with open_ids
 path: location to write the file to
 dict: dictionary containing mappings of entities or relations to IDs
 """
 def save_ids(path, dict):
-    # Sort the dictionary by value (outputs list of tuples)
-    dict = sorted(dict.items(), key=lambda x : x[1])
+    # IdDicts only hold the new IDs, so the previously generated IDs are written first
+    if isinstance(dict, IdDict):
+        by_id = chain(ids_by_id(dict.base), dict.items())
+        by_key = merge(ids_by_key(dict.base), sort_ids(dict))
+    else:
+        by_id = ids_by_id(dict)
+        by_key = sort_ids(dict)
 
     with open(path, "w") as f:
-        for i in dict:
+        for i in by_id:
             f.write(str(i[1]) + "\t" + str(i[0]) + "\n")
 
+    save_ids_binary(os.path.splitext(path)[0] + ".bin", by_key)
+
 
 """
 Loads mappings of IDs to strings from a file
@@ -206,24 +404,72 @@ def load_ids(path, dict):
     
     return dict
 
+
 """
-Loads the content of a .ttl file into a list and strips unnecessary content and punctuation
+Opens previously generated mappings of IDs to strings for lookups
+Uses the memory-mapped binary copy saved by save_ids if it is up to date, so that no mappings need to be parsed up front
+Otherwise, falls back to loading the text file into a dictionary
+path: location of the text file (e.g., entity_ids.txt)
+"""
+def open_ids(path):
+    binary_path = os.path.splitext(path)[0] + ".bin"
+    if os.path.exists(binary_path) and os.path.getmtime(binary_path) >= os.path.getmtime(path):
+        return MappedIds(binary_path)
+
+    return {key: int(id) for key, id in load_ids(path, {}).items()}
+
+"""
+Removes the quotes around quoted strings in a token, as shlex does
+token: token as matched by TOKEN_REGEX
+"""
+def unquote(token):
+    # With only one kind of quote in the token, every quote character is a delimiter
+    if "'" not in token:
+        return token.replace('"', "")
+    if '"' not in token:
+        return token.replace("'", "")
+    return QUOTED_REGEX.sub(lambda match: match.group(1) if match.group(1) is not None else match.group(2), token)
+
+
+"""
+Splits a line of a .ttl file into tokens, giving the same result as shlex.split with a single regex pass
+Quoted literals are kept as one token with their quotes removed
+Lines with backslash escapes or unbalanced quotes are rare, so they are left to shlex rather than reimplementing its rules
+line: line to split
+"""
+def split_line(line):
+    if "\\" in line:
+        return shlex.split(line)
+
+    tokens = TOKEN_REGEX.findall(line)
+    if '"' in tokens or "'" in tokens:
+        return shlex.split(line)
+
+    return [unquote(token) if '"' in token or "'" in token else token for token in tokens]
+
+
+"""
+Streams the content of a .ttl file one line at a time, stripping unnecessary content and punctuation
+Yields a list of tokens for each line, skipping prefix definitions and empty lines
 path: path to file from which to load content
+split: function used to split each line into tokens
 """
-def load_content(path):
+def iter_content(path, split=split_line):
     with open(path, "r") as file:
-        lines = []
-        content = file.readlines()
-
-        # Skip prefix definitions
-        for i in range(len(content)):
-            if content[i].startswith("@prefix") or content[i] == "\n":
+        for line in file:
+            # Skip prefix definitions
+            if line.startswith("@prefix") or line == "\n":
                 continue
 
             # Make a list of each line, and take out trailing newlines, periods, and semicolons
-            lines.append(shlex.split(content[i].rstrip("\n").rstrip(";").rstrip(".")))
+            # Commas separating object entities need to be stripped separately to prevent stripping from log messages
+            yield [token for token in split(line.rstrip("\n").rstrip(";").rstrip(".")) if token != ","]
 
-        # Commas separating object entities need to be stripped separately to prevent stripping from log messages
-        lines = [[j for j in i if j != ","] for i in lines]
 
-    return lines
+"""
+Loads the content of a .ttl file into a list and strips unnecessary content and punctuation
+path: path to file from which to load content
+split: function used to split each line into tokens
+"""
+def load_content(path, split=split_line):
+    return list(iter_content(path, split))